@@ -1,12 +1,34 @@
-import smtplib
 import requests
-from email.message import EmailMessage
 import os
+import json
+import copy
+import logging
+import math
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, jsonify
-from premailer import transform
+from flask import Flask, Response, render_template, request, jsonify, send_file
+from metadata_cache import MetadataCache, MISS
+from http_client import HttpClient
+from search_cache import QueryCache, normalize_query
+from mailer import BulkMailer
+from jobs import JobCancelled, JobQueue, QueueClosed, FINISHED_STATUSES
+from email_finalizer import EmailFinalizer, align_floating_images
+from renderer import NewsletterRenderer, get_layout
+from fragment_store import FragmentStore
+from exporter import DocumentExporter, FORMATS as EXPORT_FORMATS
+from image_cache import PosterCache
+from plex_library import LibraryIndex
+from title_index import TitleIndex
+from instrumentation import configure_logging, metrics
 
 load_dotenv()
+configure_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "text"))
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
@@ -14,404 +36,565 @@ app = Flask(__name__)
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 OMDB_API_KEY = os.getenv("OMDB_API_KEY")
 PLEX_OWNER_NAME = os.getenv("PLEX_OWNER_NAME", "Plex")
+# Dumping full upstream responses is expensive and noisy, so it has to be switched on explicitly
+LOG_PAYLOADS = os.getenv("LOG_PAYLOADS", "").lower() in ("1", "true", "yes")
+ENRICH_MAX_WORKERS = int(os.getenv("ENRICH_MAX_WORKERS", "8"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+SEARCH_WORKERS = 4
+# Keep-alive connections per upstream host: enough for every job enriching at once plus searches,
+# since urllib3 closes the connections that don't fit back into the pool
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", str(JOB_WORKERS * ENRICH_MAX_WORKERS + SEARCH_WORKERS)))
+TMDB_API_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3")
+OMDB_API_URL = os.getenv("OMDB_API_URL", "https://www.omdbapi.com/")
+
+api_client = HttpClient(
+    timeout=(float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")), float(os.getenv("HTTP_READ_TIMEOUT", "10"))),
+    max_retries=int(os.getenv("HTTP_MAX_RETRIES", "3")),
+    pool_size=HTTP_POOL_SIZE,
+    rate_limits={
+        "api.themoviedb.org": float(os.getenv("TMDB_RATE_LIMIT", "40")),
+        "www.omdbapi.com": float(os.getenv("OMDB_RATE_LIMIT", "10")),
+    },
+)
+search_cache = QueryCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "256")),
+    ttl=int(os.getenv("SEARCH_CACHE_TTL", "300")),
+)
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+# Built offline with `python title_index.py`; without it every search goes to TMDB
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "title_index.bin")
+SEARCH_INDEX_MIN_SCORE = float(os.getenv("SEARCH_INDEX_MIN_SCORE", "0.75"))
+SEARCH_INDEX_LIMIT = int(os.getenv("SEARCH_INDEX_LIMIT", "20"))
+title_index = TitleIndex(SEARCH_INDEX_PATH) if os.path.exists(SEARCH_INDEX_PATH) else None
+mailer = BulkMailer(
+    os.getenv("SMTP_HOST", "smtp.gmail.com"),
+    int(os.getenv("SMTP_PORT", "465")),
+    os.getenv("GMAIL_USER"),
+    os.getenv("GMAIL_PASSWORD"),
+    use_ssl=os.getenv("SMTP_USE_SSL", "true").lower() in ("1", "true", "yes"),
+    batch_size=int(os.getenv("MAIL_BATCH_SIZE", "50")),
+    batch_delay=float(os.getenv("MAIL_BATCH_DELAY", "1.0")),
+    max_retries=int(os.getenv("MAIL_MAX_RETRIES", "3")),
+)
+poster_cache = PosterCache(
+    os.getenv("IMAGE_CACHE_DIR", "image_cache"),
+    fetch=api_client.get,
+    base_url=os.getenv("PUBLIC_BASE_URL"),
+    scale=int(os.getenv("IMAGE_SCALE", "2")),
+    image_format=os.getenv("IMAGE_FORMAT", "jpeg"),
+    quality=int(os.getenv("IMAGE_QUALITY", "80")),
+)
+fragment_store = FragmentStore(
+    os.getenv("FRAGMENT_STORE_PATH", "fragment_store.sqlite3"),
+    max_entries=int(os.getenv("FRAGMENT_STORE_MAX_ENTRIES", "20000")),
+)
+renderer = NewsletterRenderer(
+    PLEX_OWNER_NAME,
+    fragment_cache_size=int(os.getenv("FRAGMENT_CACHE_SIZE", "2048")),
+    poster_url=poster_cache.poster_url,
+    fragment_store=fragment_store,
+    # Cards are inline-styled already; storing them with the finalizer's one fast-path edit applied
+    # leaves the whole-document pass with nothing to change in them
+    finalize_fragment=align_floating_images,
+    settings_fingerprint=json.dumps([poster_cache.cache_dir, poster_cache.base_url, poster_cache.scale,
+                                     poster_cache.image_format, poster_cache.quality]),
+    # Stored cards link to /img keys; re-render them if the image cache lost their specs
+    check_fragment=poster_cache.has_images,
+)
+exporter = DocumentExporter(
+    os.getenv("EXPORT_CACHE_DIR", "export_cache"),
+    workers=int(os.getenv("EXPORT_WORKERS", "2")),
+    width=int(os.getenv("EXPORT_WIDTH", "700")),
+    scale=float(os.getenv("EXPORT_SCALE", "2")),
+    tile_height=int(os.getenv("EXPORT_TILE_HEIGHT", "4000")),
+    timeout=int(os.getenv("EXPORT_TIMEOUT", "30")),
+    fetch=api_client.get,
+    # Exported pages may only load posters from TMDB or our own /img
+    image_sources=["https://image.tmdb.org/"] + ([f"{poster_cache.base_url}/img/"] if poster_cache.base_url else []),
+)
+PREVIEW_SESSIONS_MAX = int(os.getenv("PREVIEW_SESSIONS_MAX", "100"))
+preview_sessions = OrderedDict()
+preview_lock = threading.Lock()
+email_finalizer = EmailFinalizer(
+    mode=os.getenv("FINALIZER_MODE", "fast"),
+    cache_size=int(os.getenv("FINALIZER_CACHE_SIZE", "32")),
+)
+# Batch generation runs premailer for its issues in separate processes; 0 keeps it in-process
+FINALIZER_PROCESSES = int(os.getenv("FINALIZER_PROCESSES", str(min(4, os.cpu_count() or 1))))
+finalizer_pool = None
+finalizer_pool_lock = threading.Lock()
+BATCH_MAX_ISSUES = int(os.getenv("BATCH_MAX_ISSUES", "20"))
+job_queue = JobQueue(
+    max_workers=JOB_WORKERS,
+    retention=int(os.getenv("JOB_RETENTION", "3600")),
+)
+# How long a shutdown waits for queued and running sends before giving up on them
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "120"))
+
+metadata_cache = MetadataCache(
+    os.getenv("METADATA_CACHE_PATH", "metadata_cache.sqlite3"),
+    tmdb_ttl=int(os.getenv("TMDB_CACHE_TTL", "86400")),
+    omdb_ttl=int(os.getenv("OMDB_CACHE_TTL", "604800")),
+    negative_ttl=int(os.getenv("OMDB_NEGATIVE_CACHE_TTL", "86400")),
+    max_entries=int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "5000")),
+)
+# Plex library exports (XML/JSON) or database copies, separated like PATH
+PLEX_LIBRARY_SOURCES = [path for path in os.getenv("PLEX_LIBRARY_SOURCES", "").split(os.pathsep) if path]
+LIBRARY_NEW_DAYS = float(os.getenv("LIBRARY_NEW_DAYS", "7"))
+library_index = LibraryIndex(os.getenv("PLEX_INDEX_PATH", "plex_index.sqlite3"))
+library_lock = threading.Lock()
 
 def get_rotten_tomatoes_scores(imdb_id):
-    """Fetches movie ratings from OMDb and prints debug info."""
+    """Fetches movie ratings from OMDb (or the metadata cache)."""
     if not imdb_id or not OMDB_API_KEY:
-        print("[RT DEBUG] Skipped: Missing IMDb ID or OMDb API Key.")
+        logger.debug("Skipping RT lookup: missing IMDb ID or OMDb API key")
         return None
     
+    cached = metadata_cache.get_omdb(imdb_id)
+    if cached is not MISS:
+        return cached
+    
     try:
-        omdb_url = f"https://www.omdbapi.com/?i={imdb_id}&apikey={OMDB_API_KEY}"
-        print(f"[RT DEBUG] Fetching scores for IMDb ID: {imdb_id}")
-        print(f"[RT DEBUG] OMDb URL: {omdb_url.split('&apikey=')[0]}&apikey=...")
-        
-        response = requests.get(omdb_url)
-        response.raise_for_status()
-        data = response.json()
+        with metrics.timer("omdb_fetch", imdb_id=imdb_id):
+            response = api_client.get(OMDB_API_URL, params={"i": imdb_id, "apikey": OMDB_API_KEY})
+            response.raise_for_status()
+            data = response.json()
         
-        print(f"[RT DEBUG] OMDb Response: {data}")
+        if LOG_PAYLOADS:
+            logger.debug("OMDb response", extra={"fields": {"imdb_id": imdb_id, "payload": data}})
 
+        score = None
         if data.get("Response") == "True":
             for rating in data.get("Ratings", []):
                 if rating["Source"] == "Rotten Tomatoes":
-                    return rating["Value"]
+                    score = rating["Value"]
+                    break
+        # A missing score is cached too, so titles without one are not re-queried every time
+        metadata_cache.set_omdb(imdb_id, score)
+        return score
     except requests.RequestException as e:
-        print(f"[RT DEBUG] OMDb request failed: {e}")
+        logger.warning("OMDb request failed", extra={"fields": {"imdb_id": imdb_id, "error": e}})
     except Exception as e:
-        print(f"[RT DEBUG] An error occurred parsing OMDb data: {e}")
+        logger.warning("Could not parse OMDb data", extra={"fields": {"imdb_id": imdb_id, "error": e}})
     return None
 
-def generate_newsletter_html(data):
-    """Generates the final newsletter HTML using a table-based layout for email client compatibility."""
-    intro_text = data.get('introText', '').replace('\n', '<br>')
-    intro_html = f"<p style='font-size: 16px; line-height: 1.6;'>{intro_text}</p>"
-    
-    new_items_html = ""
-    if data.get("newItems"):
-        new_items_html = "<h2 style='color: #343a40; border-bottom: 2px solid #dee2e6; padding-bottom: 10px; margin-top: 30px;'>New This Week</h2>"
-        for item in data["newItems"]:
-            new_items_html += render_item_card(item)
-
-    featured_items_html = ""
-    if data.get("featuredItems"):
-        featured_intro = data.get('featuredIntroText', 'Also on the server, check out these library picks!')
-        processed_featured_intro = featured_intro.replace('\n', '<br>')
-        featured_items_html = f"<h2 style='color: #343a40; border-bottom: 2px solid #dee2e6; padding-bottom: 10px; margin-top: 30px;'>Featured Library Picks</h2><p>{processed_featured_intro}</p>"
-        for item in data["featuredItems"]:
-            featured_items_html += render_item_card(item)
-    
-    full_html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head><meta charset='UTF-8'></head>
-    <body style='font-family: Arial, sans-serif; background-color: #f5f5f5; padding: 20px; max-width: 800px; margin: auto;'>
-        <h1 style='color: #343a40;'>🎬 New on {PLEX_OWNER_NAME}'s Plex</h1>
-        {intro_html}
-        {new_items_html}
-        {featured_items_html}
-    </body>
-    </html>
-    """
-    return full_html
-
-def generate_magazine_newsletter_html(data):
-    """Generates a magazine-style newsletter HTML with featured items prominently displayed."""
-    intro_text = data.get('introText', '').replace('\n', '<br>')
-    intro_html = f"<p style='font-size: 16px; line-height: 1.6; margin-bottom: 30px;'>{intro_text}</p>"
-    
-    # Magazine header
-    header_html = f"""
-    <div style='text-align: center; margin-bottom: 40px; border-bottom: 3px solid #e74c3c; padding-bottom: 20px;'>
-        <h1 style='font-size: 36px; font-weight: bold; color: #2c3e50; margin: 0; letter-spacing: 2px;'>MONTHLY NEWSLETTER</h1>
-        <p style='font-size: 14px; color: #7f8c8d; margin: 5px 0 0 0;'>{PLEX_OWNER_NAME}'s Plex Server</p>
-    </div>
-    """
-    
-    # New This Week section
-    new_section_html = ""
-    if data.get("featuredNewItem") or data.get("newItems"):
-        # Exclude the featured item from additional items
-        new_additional_items = data.get("newItems", [])[1:] if data.get("newItems") else []
-        new_section_html = render_magazine_section(
-            title="NEW THIS WEEK",
-            featured_item=data.get("featuredNewItem"),
-            additional_items=new_additional_items,
-            longform_content=data.get("newItemsLongform", "")
-        )
-    
-    # Featured Library Picks section
-    featured_section_html = ""
-    if data.get("featuredLibraryItem") or data.get("featuredItems"):
-        # Exclude the featured item from additional items
-        featured_additional_items = data.get("featuredItems", [])[1:] if data.get("featuredItems") else []
-        featured_section_html = render_magazine_section(
-            title="PLEX PICKS - THIS WEEK'S FEATURE",
-            featured_item=data.get("featuredLibraryItem"),
-            additional_items=featured_additional_items,
-            longform_content=data.get("libraryPicksLongform", "")
-        )
-    
-    full_html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head><meta charset='UTF-8'></head>
-    <body style='font-family: Georgia, serif; background-color: #f8f9fa; padding: 20px; max-width: 900px; margin: auto;'>
-        {header_html}
-        {intro_html}
-        {new_section_html}
-        {featured_section_html}
-    </body>
-    </html>
-    """
-    return full_html
-
-def render_magazine_section(title, featured_item, additional_items, longform_content):
-    """Renders a magazine-style section with featured item on left and small cards on right."""
-    print(f"[DEBUG] render_magazine_section - title: {title}, longform_content: '{longform_content}'")
-    section_html = f"""
-    <div style='margin-bottom: 50px;'>
-        <h2 style='font-size: 24px; font-weight: bold; color: #2c3e50; text-align: center; margin-bottom: 30px; text-transform: uppercase; letter-spacing: 1px;'>{title}</h2>
-        <table cellpadding='0' cellspacing='0' border='0' width='100%'>
-            <tr>
-                <td width='60%' valign='top' style='padding-right: 20px;'>
-    """
-    
-    # Featured item on the left
-    if featured_item:
-        section_html += render_featured_item(featured_item, longform_content)
-    else:
-        section_html += "<div style='background: #ecf0f1; padding: 40px; text-align: center; border-radius: 10px; color: #7f8c8d;'>No featured item selected</div>"
-    
-    section_html += """
-                </td>
-                <td width='40%' valign='top'>
-    """
-    
-    # Small cards on the right
-    if additional_items:
-        section_html += "<div style='background: #ffffff; padding: 20px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);'>"
-        section_html += "<h3 style='font-size: 16px; color: #2c3e50; margin: 0 0 15px 0; text-align: center;'>Also This Week</h3>"
-        for item in additional_items:
-            section_html += render_small_card(item)
-        section_html += "</div>"
-    else:
-        section_html += "<div style='background: #ecf0f1; padding: 20px; text-align: center; border-radius: 10px; color: #7f8c8d;'>No additional items</div>"
-    
-    section_html += """
-                </td>
-            </tr>
-        </table>
-    </div>
-    """
-    
-    return section_html
-
-def render_featured_item(item, longform_content=""):
-    """Renders a large featured item for the magazine layout."""
-    print(f"[DEBUG] render_featured_item - item: {item['title'] if item else 'None'}, longform_content: '{longform_content}'")
-    rt_block = ""
-    if item.get("rt_critic_score"):
-        rt_block = f"<div style='color: #e74c3c;'>🍅 {item['rt_critic_score']}</div>"
-    
-    # Handle custom blurb (user-entered blurb) with italic grey styling
-    custom_blurb_html = ""
-    if item.get('blurb'):
-        custom_blurb_html = f"<div style='font-size: 15px; color: #7f8c8d; line-height: 1.6; font-style: italic; margin-top: 15px;'>\"{item['blurb']}\"</div>"
-    
-    # Use longform content as the Editor's Note with black text
-    blurb_html = ""
-    if longform_content:
-        processed_longform = longform_content.replace('\n', '<br>')
-        blurb_html = f"<div style='margin-top: 20px; clear: both;'><h4 style='font-size: 16px; font-weight: bold; color: #2c3e50; margin: 0 0 10px 0; border-bottom: 1px solid #ecf0f1; padding-bottom: 5px;'>Editor's Note</h4><div style='font-size: 15px; color: #000000; line-height: 1.6;'>{processed_longform}</div></div>"
-        print(f"[DEBUG] blurb_html generated: {blurb_html[:100]}...")
-    
-    return f"""
-    <div style='background: #ffffff; border-radius: 15px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.1); padding: 25px;'>
-        <div style='overflow: hidden;'>
-            <img src="{item['poster_url']}" alt="{item['title']} poster" style="width: 200px; height: 300px; object-fit: cover; float: left; margin: 0 25px 15px 0; border-radius: 8px;">
-            
-            <h3 style='font-size: 24px; font-weight: bold; margin: 0 0 8px 0; color: #2c3e50;'>{item['title']}</h3>
-            <p style='font-size: 16px; color: #7f8c8d; margin: 0 0 15px 0;'>{item['year']} • {item.get('type', 'Movie')}</p>
-            
-            <div style='margin-bottom: 15px;'>
-                <div style='margin-bottom: 5px;'>
-                    <span style='font-size: 18px; font-weight: bold; color: #f39c12;'>⭐ {item['rating']}/10</span>
-                    <span style='font-size: 14px; color: #95a5a6; margin-left: 10px;'>({item['votes']:,} votes)</span>
-                </div>
-                {rt_block if item.get('rt_critic_score') else ''}
-            </div>
-            
-            <p style='font-size: 14px; color: #7f8c8d; margin: 0 0 15px 0; font-weight: 500;'>{item['genres']}</p>
-            
-            <div style='font-size: 15px; color: #2c3e50; line-height: 1.6;'>{item['overview']}</div>
-            
-            {custom_blurb_html}
-            
-            {blurb_html}
-        </div>
-    </div>
-    """
+def search_tmdb(media_type, query):
+    """Runs one TMDB search, returning (results, complete, ok) for the first page."""
+    with metrics.timer("tmdb_search", media_type=media_type):
+        response = api_client.get(f"{TMDB_API_URL}/search/{media_type}", params={"api_key": TMDB_API_KEY, "query": query})
+    data = response.json()
+    results = data.get("results", [])
+    return results, data.get("total_results", 0) <= len(results), response.ok
 
-def render_small_card(item):
-    """Renders a small card for additional items in the magazine layout."""
-    rt_block = ""
-    if item.get("rt_critic_score"):
-        rt_block = f" • 🍅 {item['rt_critic_score']}"
-    
-    custom_blurb = ""
-    if item.get('blurb'):
-        custom_blurb = f"<p style='font-size: 11px; color: #2c3e50; line-height: 1.3; margin: 4px 0 0 0; font-style: italic;'>\"{item['blurb']}\"</p>"
-    
-    return f"""
-    <div style='display: flex; margin-bottom: 15px; padding-bottom: 15px; border-bottom: 1px solid #ecf0f1;'>
-        <div style='flex-shrink: 0; margin-right: 12px;'>
-            <img src="{item['poster_url']}" alt="{item['title']} poster" width="60" style="width: 60px; height: 90px; object-fit: cover; border-radius: 5px; display: block;">
-        </div>
-        <div style='flex: 1; min-width: 0;'>
-            <h4 style='font-size: 14px; font-weight: bold; margin: 0 0 4px 0; color: #2c3e50; line-height: 1.3;'>{item['title']}</h4>
-            <p style='font-size: 12px; color: #7f8c8d; margin: 0 0 6px 0;'>{item['year']} • {item.get('type', 'Movie')}</p>
-            <div style='font-size: 12px; color: #f39c12; margin-bottom: 4px;'>⭐ {item['rating']}/10{rt_block}</div>
-            <p style='font-size: 11px; color: #95a5a6; line-height: 1.3; margin: 0;'>{item['genres']}</p>
-            {custom_blurb}
-        </div>
-    </div>
-    """
+def search_local(query):
+    """Answers a search from the local title index, or returns None so the caller asks TMDB.
 
-def render_item_card(item):
-    """Helper function to render a single movie/show card HTML using a table layout."""
-    rt_block = ""
-    if item.get("rt_critic_score"):
-        rt_block = f"""
-            <td width="15"></td>
-            <td valign="top" align="left" style="text-align: left;">
-                <div style="font-size: 16px; font-weight: bold; color: #333;">🍅 {item['rt_critic_score']}</div>
-                <div style="font-size: 12px; color: #555;">Tomatometer</div>
-            </td>
-        """
-    
-    return f"""
-    <table cellpadding="0" cellspacing="0" border="0" width="100%" style="background: white; border-radius: 10px; margin-bottom: 20px;">
-        <tr>
-            <td style="padding: 15px;">
-                <table cellpadding="0" cellspacing="0" border="0" width="100%">
-                    <tr>
-                        <td width="150" valign="top">
-                            <img src="{item['poster_url']}" alt="{item['title']} poster" width="150" style="width: 150px; border-radius: 8px; display: block;">
-                        </td>
-                        <td width="20"></td>
-                        <td valign="top">
-                            <div style="font-size: 20px; font-weight: bold; margin-bottom: 5px;">{item['title']} ({item['year']})</div>
-                            <div style="font-size: 14px; color: #777; margin-bottom: 8px;">{item.get('type', 'Movie')}</div>
-                            
-                            <table cellpadding="0" cellspacing="0" border="0" style="margin-bottom: 8px;">
-                                <tr>
-                                    <td valign="top" align="left" style="text-align: left;">
-                                        <div style="font-size: 16px; font-weight: bold; color: #333;">⭐ {item['rating']}/10</div>
-                                        <div style="font-size: 12px; color: #555;">TMDB ({item['votes']:,} votes)</div>
-                                    </td>
-                                    {rt_block}
-                                </tr>
-                            </table>
-                            <div style="font-size: 14px; color: #555; margin-bottom: 8px;">{item['genres']}</div>
-                            <div style="font-style: italic; margin-bottom: 12px; border-left: 3px solid #eee; padding-left: 10px;">"{item.get('blurb', 'No blurb provided.')}"</div>
-                            <div style="font-size: 14px; color: #333;">{item['overview']}</div>
-                        </td>
-                    </tr>
-                </table>
-            </td>
-        </tr>
-    </table>
+    Hits without a year or poster (titles known only from the id export) are completed
+    from the metadata cache when it has their details. Otherwise they are returned
+    without them; no upstream call is made on this path.
     """
+    if title_index is None:
+        return None
+    with metrics.timer("index_search"):
+        hits = title_index.search(query, limit=SEARCH_INDEX_LIMIT)
+    if not hits or hits[0]["score"] < SEARCH_INDEX_MIN_SCORE:
+        metrics.inc("search_index_total", result="miss")
+        return None
+    known = metadata_cache.peek_tmdb((hit["type"], hit["id"]) for hit in hits if not hit["year"] or not hit["poster_path"])
+    items = []
+    for hit in hits:
+        details = known.get((hit["type"], hit["id"]))
+        if details is not None:
+            poster_path = details["poster_url"].rsplit("/w500", 1)[-1]
+            hit = dict(hit, title=details["title"] or hit["title"], year=hit["year"] or int(details["year"] or 0) or None,
+                       poster_path=hit["poster_path"] or (poster_path if poster_path.startswith("/") else None))
+        items.append({"id": hit["id"], "type": hit["type"], "title": hit["title"], "year": str(hit["year"] or ""),
+                      "poster_url": f"https://image.tmdb.org/t/p/w200{hit['poster_path']}" if hit["poster_path"] else None,
+                      "popularity": hit["popularity"]})
+    metrics.inc("search_index_total", result="hit")
+    return items
 
-# Keep the /search endpoint the same as before
 @app.route("/search")
 def search_media():
     query = request.args.get("query")
     if not query:
         return jsonify({"error": "Query parameter is required"}), 400
+    query = normalize_query(query)
+    if not query:
+        return jsonify({"error": "Query parameter is required"}), 400
+    cached = search_cache.get(query)
+    if cached is not None:
+        return jsonify(cached)
+    items = search_local(query)
+    if items is not None:
+        # Not marked complete: the index may hold only part of what TMDB would return
+        search_cache.put(query, items, False)
+        return jsonify(items)
     try:
-        movie_url = f"https://api.themoviedb.org/3/search/movie?api_key={TMDB_API_KEY}&query={query}"
-        tv_url = f"https://api.themoviedb.org/3/search/tv?api_key={TMDB_API_KEY}&query={query}"
-        movie_results = requests.get(movie_url).json().get("results", [])
-        tv_results = requests.get(tv_url).json().get("results", [])
+        # Run the movie and TV searches concurrently
+        movie_future = search_executor.submit(search_tmdb, "movie", query)
+        tv_results, tv_complete, tv_ok = search_tmdb("tv", query)
+        movie_results, movie_complete, movie_ok = movie_future.result()
         items = []
         for res in movie_results:
             if res.get("poster_path") and res.get("release_date"):
-                items.append({"id": res["id"], "type": "movie", "title": res["title"], "year": res["release_date"][:4], "poster_url": f"https://image.tmdb.org/t/p/w200{res['poster_path']}"})
+                items.append({"id": res["id"], "type": "movie", "title": res["title"], "year": res["release_date"][:4], "poster_url": f"https://image.tmdb.org/t/p/w200{res['poster_path']}", "popularity": res.get("popularity", 0)})
         for res in tv_results:
             if res.get("poster_path") and res.get("first_air_date"):
-                items.append({"id": res["id"], "type": "tv", "title": res["name"], "year": res["first_air_date"][:4], "poster_url": f"https://image.tmdb.org/t/p/w200{res['poster_path']}"})
+                items.append({"id": res["id"], "type": "tv", "title": res["name"], "year": res["first_air_date"][:4], "poster_url": f"https://image.tmdb.org/t/p/w200{res['poster_path']}", "popularity": res.get("popularity", 0)})
         items.sort(key=lambda x: x.get('popularity', 0), reverse=True)
+        if movie_ok and tv_ok:
+            search_cache.put(query, items, movie_complete and tv_complete)
         return jsonify(items)
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
 
-def enrich_item(item):
-    """Fetches full details for a single item (movie or TV) from APIs."""
-    item_type = item.get("type", "movie")
+def normalize_details(item_type, details):
+    """Maps a raw TMDB details payload onto the fields used by the newsletter cards."""
     if item_type == "movie":
-        details_url = f"https://api.themoviedb.org/3/movie/{item['id']}?api_key={TMDB_API_KEY}"
-        details = requests.get(details_url).json()
-        rt_score = get_rotten_tomatoes_scores(details.get("imdb_id"))
         return {
             "type": "Movie", "title": details.get("title"), "year": details.get("release_date", "")[:4],
             "rating": round(details.get("vote_average", 0), 1), "votes": details.get("vote_count", 0),
             "genres": ", ".join(g["name"] for g in details.get("genres", [])),
             "poster_url": f"https://image.tmdb.org/t/p/w500{details.get('poster_path', '')}",
-            "overview": details.get("overview", ""), "blurb": item.get("blurb", ""),
-            "rt_critic_score": rt_score
+            "overview": details.get("overview", ""), "imdb_id": details.get("imdb_id")
         }
-    elif item_type == "tv":
-        details_url = f"https://api.themoviedb.org/3/tv/{item['id']}?api_key={TMDB_API_KEY}"
-        details = requests.get(details_url).json()
-        return {
-            "type": "TV Show", "title": details.get("name"), "year": details.get("first_air_date", "")[:4],
-            "rating": round(details.get("vote_average", 0), 1), "votes": details.get("vote_count", 0),
-            "genres": ", ".join(g["name"] for g in details.get("genres", [])),
-            "poster_url": f"https://image.tmdb.org/t/p/w500{details.get('poster_path', '')}",
-            "overview": details.get("overview", ""), "blurb": item.get("blurb", "")
-        }
-    return None
+    return {
+        "type": "TV Show", "title": details.get("name"), "year": details.get("first_air_date", "")[:4],
+        "rating": round(details.get("vote_average", 0), 1), "votes": details.get("vote_count", 0),
+        "genres": ", ".join(g["name"] for g in details.get("genres", [])),
+        "poster_url": f"https://image.tmdb.org/t/p/w500{details.get('poster_path', '')}",
+        "overview": details.get("overview", "")
+    }
+
+def get_title_details(item_type, tmdb_id):
+    """Returns normalized TMDB details for a title, served from the metadata cache when fresh."""
+    cached = metadata_cache.get_tmdb(item_type, tmdb_id)
+    if cached is not MISS:
+        return cached
+    details_url = f"{TMDB_API_URL}/{item_type}/{tmdb_id}"
+    with metrics.timer("tmdb_fetch", item_type=item_type, tmdb_id=tmdb_id):
+        details = api_client.get(details_url, params={"api_key": TMDB_API_KEY}).json()
+    if LOG_PAYLOADS:
+        logger.debug("TMDB response", extra={"fields": {"item_type": item_type, "tmdb_id": tmdb_id, "payload": details}})
+    normalized = normalize_details(item_type, details)
+    # Only cache real titles; TMDB error payloads carry no id
+    if details.get("id"):
+        metadata_cache.set_tmdb(item_type, tmdb_id, normalized)
+    return normalized
+
+def enrich_item(item):
+    """Fetches full details for a single item (movie or TV) from APIs."""
+    item_type = item.get("type", "movie")
+    if item_type not in ("movie", "tv"):
+        return None
+    enriched = dict(get_title_details(item_type, item["id"]))
+    imdb_id = enriched.pop("imdb_id", None)
+    enriched["id"] = item["id"]
+    enriched["blurb"] = item.get("blurb", "")
+    if item_type == "movie":
+        enriched["rt_critic_score"] = get_rotten_tomatoes_scores(imdb_id)
+    return enriched
+
+def _safe_enrich_item(item):
+    """Enriches one item, turning any failure into None so it is dropped like other empty results."""
+    try:
+        return enrich_item(item)
+    except Exception as e:
+        logger.warning("Failed to enrich item", extra={"fields": {"id": item.get("id"), "type": item.get("type"), "error": e}})
+        return None
+
+def enrich_items(items, max_workers=None, job=None):
+    """Enriches items concurrently, returning results in input order (None for failed items).
+
+    Each worker fetches the TMDB details and then immediately the OMDb score for that
+    title, so the Rotten Tomatoes lookup starts as soon as its imdb_id is known.
+    """
+    items = list(items)
+    if not items:
+        return []
+    if job is not None:
+        job.report("enrich", 0, len(items))
+    workers = max(1, min(max_workers or ENRICH_MAX_WORKERS, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_safe_enrich_item, item) for item in items]
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                if job is not None:
+                    job.report("enrich", done, len(items))
+        except JobCancelled:
+            for future in futures:
+                future.cancel()
+            raise
+        return [future.result() for future in futures]
+
+def title_key(item):
+    return (item.get("type", "movie"), str(item.get("id")))
+
+def enrich_with_known(items, known, job=None):
+    """Enriches items, reusing titles already in `known` so only their blurb is refreshed.
+
+    Newly enriched titles are added to `known`; each distinct title is fetched once even if
+    it appears several times (e.g. the magazine's featured item is also first in its list).
+    """
+    missing = {}
+    for item in items:
+        if title_key(item) not in known:
+            missing.setdefault(title_key(item), item)
+    for key, enriched in zip(missing, enrich_items(missing.values(), job=job)):
+        if enriched:
+            known[key] = enriched
+    results = []
+    for item in items:
+        enriched = known.get(title_key(item))
+        results.append(dict(enriched, blurb=item.get("blurb", "")) if enriched else None)
+    return results
+
+def render_newsletter(layout, data, enriched, job=None):
+    """Renders the layout and makes the document email-ready."""
+    if job is not None:
+        job.report("render")
+    with metrics.timer("render", layout=layout.name):
+        original_html = renderer.render(layout, layout.context(data, enriched))
+    
+    if job is not None:
+        job.report("inline css")
+    with metrics.timer("inline_css", layout=layout.name):
+        return email_finalizer.finalize(original_html)
+
+def save_preview(preview_id, data, known):
+    """Keeps the request and its enriched titles so later edits can be previewed incrementally."""
+    with preview_lock:
+        preview_sessions[preview_id] = {"data": data, "known": known}
+        preview_sessions.move_to_end(preview_id)
+        while len(preview_sessions) > PREVIEW_SESSIONS_MAX:
+            preview_sessions.popitem(last=False)
+
+def apply_changes(data, changes):
+    """Applies [{"path": [...], "value": ...}] edits to a copy of the newsletter request."""
+    if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+        raise ValueError("changes must be a list of {\"path\": [...], \"value\": ...} objects")
+    data = copy.deepcopy(data)
+    for change in changes:
+        path = change.get("path")
+        if not isinstance(path, list) or not path:
+            raise ValueError(f"Invalid change: {change}")
+        try:
+            target = data
+            for key in path[:-1]:
+                target = target[key]
+            target[path[-1]] = change.get("value")
+        except (KeyError, IndexError, TypeError):
+            raise ValueError(f"Invalid change path: {path}")
+    for key in ("newItems", "featuredItems"):
+        items = data.get(key, [])
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError(f"{key} must be a list of items")
+    for key in ("featuredNewItem", "featuredLibraryItem"):
+        if data.get(key) and not isinstance(data[key], dict):
+            raise ValueError(f"{key} must be an item")
+    return data
+
+def resolve_tmdb_id(entry):
+    """Finds the TMDB id for a library title that Plex only knows by its IMDb or TVDB id."""
+    source, external_id = ("imdb_id", entry["imdb_id"]) if entry["imdb_id"] else ("tvdb_id", entry["tvdb_id"])
+    with metrics.timer("tmdb_find", external_source=source):
+        response = api_client.get(f"{TMDB_API_URL}/find/{external_id}", params={"api_key": TMDB_API_KEY, "external_source": source})
+    response.raise_for_status()
+    results = response.json().get("movie_results" if entry["type"] == "movie" else "tv_results") or []
+    return results[0]["id"] if results else None
+
+def library_new_items(since=None, job=None):
+    """Returns (items, since, cutoff) for titles added to Plex after `since`.
+
+    `since` defaults to the cutoff of the last issue sent from the library, or
+    LIBRARY_NEW_DAYS ago. The index is rescanned first, which is cheap when the
+    exports have not changed.
+    """
+    cutoff = time.time()
+    if since is None:
+        since = library_index.last_issue_at() or cutoff - LIBRARY_NEW_DAYS * 86400
+    with library_lock:
+        if job is not None:
+            job.report("library scan")
+        with metrics.timer("library_scan"):
+            stats = library_index.scan(PLEX_LIBRARY_SOURCES)
+        logger.info("Scanned Plex library", extra={"fields": stats})
+        pending = library_index.unresolved(since)
+        for done, entry in enumerate(pending):
+            if job is not None:
+                job.report("resolve ids", done, len(pending))
+            try:
+                library_index.set_tmdb_id(entry["source"], entry["key"], resolve_tmdb_id(entry))
+            except requests.RequestException as e:
+                logger.warning("TMDB id lookup failed", extra={"fields": {"key": entry["key"], "error": e}})
+    return library_index.added_since(since), since, cutoff
+
+def fill_new_items(data, job=None):
+    """Appends library titles added since the last issue to newItems when the request asks for it.
+
+    Returns the updated request and the cutoff to record once the issue is sent (None
+    when the library was not used).
+    """
+    if not data.get("newItemsFromLibrary"):
+        return data, None
+    items, _, cutoff = library_new_items(data.get("newSince"), job=job)
+    data = {key: value for key, value in data.items() if key not in ("newItemsFromLibrary", "newSince")}
+    new_items = list(data.get("newItems") or [])
+    picked = {title_key(item) for item in new_items}
+    new_items += [{"id": item["id"], "type": item["type"], "blurb": ""}
+                  for item in items if title_key(item) not in picked]
+    data["newItems"] = new_items
+    if get_layout(data).name == "magazine" and not data.get("featuredNewItem") and new_items:
+        data["featuredNewItem"] = new_items[0]
+    return data, cutoff
+
+def build_newsletter(data, job=None):
+    """Enriches, renders and inlines a newsletter using the layout named in the request."""
+    data, library_cutoff = fill_new_items(data, job=job)
+    layout = get_layout(data)
+    logger.info("Generating newsletter", extra={"fields": {"layout": layout.name, "keys": sorted(data)}})
+    if LOG_PAYLOADS:
+        logger.debug("Newsletter request", extra={"fields": {"payload": data}})
+    
+    # Enrich every referenced item in a single concurrent batch
+    known = {}
+    enriched = enrich_with_known(layout.collect(data), known, job=job)
+    email_ready_html = render_newsletter(layout, data, enriched, job=job)
+    
+    preview_id = uuid.uuid4().hex
+    save_preview(preview_id, data, known)
+    logger.info("Newsletter generated", extra={"fields": {"layout": layout.name, "preview": preview_id}})
+    return {"html": email_ready_html, "previewId": preview_id, "libraryCutoff": library_cutoff}
 
 @app.route("/generate", methods=["POST"])
 def generate():
-    """API endpoint to generate the newsletter, now handling both classic and magazine layouts."""
+    """Queues newsletter generation; the client follows progress via /jobs/<job_id>."""
     data = request.json
+    if not data or not isinstance(data, dict):
+        return jsonify({"error": "Missing newsletter data"}), 400
     try:
-        print(f"[DEBUG] Received data keys: {list(data.keys())}")
-        
-        # Check if this is a magazine-style request (from alt interface)
-        is_magazine_style = (
-            data.get("featuredNewItem") is not None or 
-            data.get("featuredLibraryItem") is not None or
-            data.get("newItemsLongform") is not None or
-            data.get("libraryPicksLongform") is not None
-        )
-        
-        print(f"[DEBUG] Magazine style detected: {is_magazine_style}")
-        
-        if is_magazine_style:
-            # Handle magazine-style layout
-            enriched_new = [enrich_item(item) for item in data.get("newItems", [])]
-            enriched_featured = [enrich_item(item) for item in data.get("featuredItems", [])]
-            
-            # Enrich featured items
-            enriched_featured_new = None
-            if data.get("featuredNewItem"):
-                enriched_featured_new = enrich_item(data["featuredNewItem"])
-                print(f"[DEBUG] Enriched featured new item: {enriched_featured_new['title'] if enriched_featured_new else 'None'}")
-            
-            enriched_featured_library = None
-            if data.get("featuredLibraryItem"):
-                enriched_featured_library = enrich_item(data["featuredLibraryItem"])
-                print(f"[DEBUG] Enriched featured library item: {enriched_featured_library['title'] if enriched_featured_library else 'None'}")
-            
-            enriched_new = [i for i in enriched_new if i]
-            enriched_featured = [i for i in enriched_featured if i]
-            
-            final_data = {
-                "introText": data.get("introText"),
-                "featuredNewItem": enriched_featured_new,
-                "newItems": enriched_new,
-                "newItemsLongform": data.get("newItemsLongform", ""),
-                "featuredLibraryItem": enriched_featured_library,
-                "featuredItems": enriched_featured,
-                "libraryPicksLongform": data.get("libraryPicksLongform", "")
-            }
-            
-            print(f"[DEBUG] newItemsLongform: '{data.get('newItemsLongform', '')}'")
-            print(f"[DEBUG] libraryPicksLongform: '{data.get('libraryPicksLongform', '')}'")
-            
-            print(f"[DEBUG] Generating magazine-style newsletter")
-            original_html = generate_magazine_newsletter_html(final_data)
-        else:
-            # Handle classic layout
-            enriched_new = [enrich_item(item) for item in data.get("newItems", [])]
-            enriched_featured = [enrich_item(item) for item in data.get("featuredItems", [])]
-            
-            enriched_new = [i for i in enriched_new if i]
-            enriched_featured = [i for i in enriched_featured if i]
-
-            final_data = {
-                "introText": data.get("introText"),
-                "newItems": enriched_new,
-                "featuredIntroText": data.get("featuredIntroText"),
-                "featuredItems": enriched_featured,
-            }
-            
-            print(f"[DEBUG] Generating classic newsletter")
-            original_html = generate_newsletter_html(final_data)
-        
-        email_ready_html = transform(original_html)
-        print(f"[DEBUG] Newsletter generated successfully")
-        return jsonify({"html": email_ready_html})
-
+        get_layout(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job = job_queue.submit("generate", build_newsletter, data)
+    return jsonify({"jobId": job.id}), 202
+
+def get_finalizer_pool():
+    """Starts the finalizer processes the first time a batch has documents that need premailer.
+
+    In "fast" mode that is rare, so the pool usually never starts. The workers are spawned
+    rather than forked, since job, enrichment and search threads are already running by
+    then; a spawned worker re-runs the main script, which is why server.py only imports
+    this module inside main().
+    """
+    global finalizer_pool
+    with finalizer_pool_lock:
+        if finalizer_pool is None and FINALIZER_PROCESSES > 0:
+            finalizer_pool = ProcessPoolExecutor(max_workers=FINALIZER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return finalizer_pool
+
+def build_newsletters(issues, job=None):
+    """Builds several issues (e.g. one per audience) in one pass.
+
+    Titles are deduplicated across all issues and enriched once, and every issue is then
+    rendered in turn from the shared results, so cost grows with unique titles rather than
+    issues x titles. Documents that need premailer are inlined in parallel on the
+    finalizer process pool; the rest take the fast path in-process.
+    """
+    filled = [fill_new_items(issue, job=job) for issue in issues]
+    issues = [issue for issue, _ in filled]
+    library_cutoff = max((cutoff for _, cutoff in filled if cutoff), default=None)
+    layouts = [get_layout(issue) for issue in issues]
+    collected = [layout.collect(issue) for layout, issue in zip(layouts, issues)]
+    logger.info("Generating newsletter batch", extra={"fields": {"issues": len(issues), "titles": sum(map(len, collected))}})
+
+    known = {}
+    enriched_all = enrich_with_known([item for items in collected for item in items], known, job=job)
+
+    documents = []
+    offset = 0
+    for index, (layout, issue, items) in enumerate(zip(layouts, issues, collected)):
+        if job is not None:
+            job.report("render", index, len(issues))
+        enriched = enriched_all[offset:offset + len(items)]
+        offset += len(items)
+        with metrics.timer("render", layout=layout.name):
+            documents.append(renderer.render(layout, layout.context(issue, enriched)))
+
+    if job is not None:
+        job.report("inline css", 0, len(documents))
+    with metrics.timer("inline_css", layout="batch"):
+        finished = email_finalizer.finalize_many(documents, executor=get_finalizer_pool)
+
+    results = []
+    for issue, html in zip(issues, finished):
+        preview_id = uuid.uuid4().hex
+        save_preview(preview_id, issue, known)
+        results.append({"name": issue.get("name"), "html": html, "previewId": preview_id})
+    logger.info("Newsletter batch generated", extra={"fields": {"issues": len(issues), "unique_titles": len(known)}})
+    return {"issues": results, "uniqueTitles": len(known), "libraryCutoff": library_cutoff}
+
+@app.route("/generate-batch", methods=["POST"])
+def generate_batch():
+    """Queues several issues at once: {"issues": [{"name": "Family", "layout": ..., ...}, ...]}.
+
+    Each issue takes the same fields as /generate. The finished job's result lists the
+    documents in request order.
+    """
+    issues = (request.json or {}).get("issues")
+    if not isinstance(issues, list) or not issues:
+        return jsonify({"error": "Missing issues"}), 400
+    if len(issues) > BATCH_MAX_ISSUES:
+        return jsonify({"error": f"At most {BATCH_MAX_ISSUES} issues per batch"}), 400
+    try:
+        for issue in issues:
+            if not isinstance(issue, dict):
+                raise ValueError("Each issue must be an object")
+            get_layout(issue)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job = job_queue.submit("generate_batch", build_newsletters, issues)
+    return jsonify({"jobId": job.id}), 202
+
+@app.route("/preview", methods=["POST"])
+def preview():
+    """Re-renders a generated newsletter after edits, reusing its enriched titles and cached cards.
+
+    Expects {"previewId": ..., "changes": [{"path": ["newItems", 0, "blurb"], "value": "..."}]}
+    where previewId comes from a finished /generate job.
+    """
+    body = request.json or {}
+    if not isinstance(body, dict) or not isinstance(body.get("previewId"), str):
+        return jsonify({"error": "previewId is required"}), 400
+    with preview_lock:
+        session = preview_sessions.get(body["previewId"])
+    if session is None:
+        return jsonify({"error": "Unknown or expired preview"}), 404
+    try:
+        data = apply_changes(session["data"], body.get("changes", []))
+        layout = get_layout(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        enriched = enrich_with_known(layout.collect(data), session["known"])
+        email_ready_html = render_newsletter(layout, data, enriched)
     except Exception as e:
-        print(f"[ERROR] Failed to generate HTML: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": f"Failed to generate HTML: {e}"}), 500
+        logger.exception("Failed to render preview")
+        return jsonify({"error": f"Failed to render preview: {e}"}), 500
+    save_preview(body["previewId"], data, session["known"])
+    return jsonify({"html": email_ready_html, "previewId": body["previewId"]})
+
+def send_issue(recipients, subject, html, library_cutoff=None, job=None):
+    """Delivers an issue; once it reached someone, the next library-filled issue starts at its cutoff."""
+    report = mailer.deliver(recipients, subject, html, job=job)
+    if library_cutoff and report["sent"]:
+        # The issue is out either way; failing the job here would invite a second send
+        try:
+            library_index.mark_issue(library_cutoff)
+        except Exception as e:
+            logger.warning("Could not record library cutoff", extra={"fields": {"cutoff": library_cutoff, "error": e}})
+    return report
 
 @app.route("/send-email", methods=["POST"])
 def send_email():
@@ -424,32 +607,157 @@ def send_email():
         return jsonify({"error": "Missing recipients, subject, or HTML content"}), 400
 
 
-    sender_email = os.getenv("GMAIL_USER")
-    sender_password = os.getenv("GMAIL_PASSWORD")
-
-    if not sender_email or not sender_password:
+    if not mailer.username or not mailer.password:
          return jsonify({"error": "Email credentials are not configured on the server."}), 500
 
+    library_cutoff = data.get("libraryCutoff")
+    if library_cutoff is not None:
+        # Checked up front: once delivery has started, a bad cutoff must not fail the job
+        try:
+            library_cutoff = float(library_cutoff)
+            if not math.isfinite(library_cutoff):
+                raise ValueError(library_cutoff)
+        except (TypeError, ValueError):
+            return jsonify({"error": "libraryCutoff must be a unix timestamp"}), 400
+
+    # Delivery runs in the background; the client follows /jobs/<job_id> for the report
+    job = job_queue.submit("send", send_issue, recipients, subject, html_content, library_cutoff)
+    return jsonify({"message": "Email queued for delivery.", "jobId": job.id}), 202
+
+@app.errorhandler(QueueClosed)
+def queue_closed(e):
+    return jsonify({"error": "The server is shutting down, try again shortly"}), 503
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict(include_result=False))
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """Streams job progress as Server-Sent Events until the job finishes.
+
+    The stream holds a server thread for the whole job, so the editors poll /jobs/<job_id>
+    instead; this is for scripts that follow a few jobs.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    def stream():
+        version = -1
+        while True:
+            new_version = job.wait(version, timeout=15)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            finished = job.status in FINISHED_STATUSES
+            yield f"data: {json.dumps(job.to_dict(include_result=finished))}\n\n"
+            if finished:
+                return
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def library_new_titles(since=None, job=None):
+    """Scans the library and looks up the titles added since `since`, ready to add as new items."""
+    items, since, cutoff = library_new_items(since, job=job)
+    details = enrich_items(({"id": item["id"], "type": item["type"]} for item in items), job=job)
+    results = []
+    for item, enriched in zip(items, details):
+        if enriched:
+            results.append({"id": item["id"], "type": item["type"], "title": enriched["title"],
+                            "year": enriched["year"], "poster_url": enriched["poster_url"], "addedAt": item["addedAt"]})
+    return {"items": results, "since": since, "cutoff": cutoff}
+
+@app.route("/library/new")
+def library_new():
+    """Queues a listing of titles added to the Plex library since the last issue (or ?since=<unix time>).
+
+    The scan, TMDB id lookups and details can take a while on a large library, so the
+    client follows /jobs/<job_id>; the finished job's result is {"items", "since", "cutoff"}.
+    """
+    if not PLEX_LIBRARY_SOURCES:
+        return jsonify({"error": "PLEX_LIBRARY_SOURCES is not configured"}), 400
     try:
-        msg = EmailMessage()
-        msg['Subject'] = subject
-        msg['From'] = sender_email
-        msg['To'] = recipients
-
-
-        msg.set_content("This is a fallback for email clients that do not support HTML.")
-        msg.add_alternative(html_content, subtype='html')
-
-
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-            smtp.login(sender_email, sender_password)
-            smtp.send_message(msg)
-        
-        return jsonify({"message": "Email sent successfully!"})
+        since = float(request.args["since"]) if request.args.get("since") else None
+    except ValueError:
+        return jsonify({"error": "since must be a unix timestamp"}), 400
+    job = job_queue.submit("library", library_new_titles, since)
+    return jsonify({"jobId": job.id}), 202
+
+@app.route("/export", methods=["POST"])
+def export_newsletter():
+    """Renders a generated newsletter to {"format": "png"} or "pdf" on the server and returns the file."""
+    body = request.json or {}
+    html_content, fmt = body.get("html"), body.get("format", "png")
+    if not html_content:
+        return jsonify({"error": "Missing HTML content"}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unsupported export format: {fmt}"}), 400
+    if not exporter.available:
+        return jsonify({"error": "Server-side export needs Playwright: pip install playwright && playwright install chromium"}), 501
+    try:
+        path = exporter.export(html_content, fmt)
+    except Exception as e:
+        logger.exception("Failed to export newsletter")
+        return jsonify({"error": f"Failed to export newsletter: {e}"}), 500
+    return send_file(path, mimetype=EXPORT_FORMATS[fmt], as_attachment=True, download_name=f"plex-newsletter.{fmt}")
 
+@app.route("/img/<key>")
+def poster_image(key):
+    """Serves a resized poster from the image cache, building it on first request."""
+    try:
+        image = poster_cache.load(key)
     except Exception as e:
-        print(f"[ERROR] Could not send email: {e}")
-        return jsonify({"error": f"Failed to send email: {e}"}), 500
+        logger.warning("Could not build poster", extra={"fields": {"key": key, "error": e}})
+        return jsonify({"error": "Poster unavailable"}), 502
+    if image is None:
+        return jsonify({"error": "Unknown image"}), 404
+    data, mimetype = image
+    return Response(data, mimetype=mimetype, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+def collect_cache_metrics():
+    """Exports hit/miss counters of the caches and queues owned by the app."""
+    stats = metadata_cache.stats()
+    for namespace, count in stats["hits"].items():
+        yield "metadata_cache_hits_total", "counter", {"namespace": namespace}, count
+    for namespace, count in stats["misses"].items():
+        yield "metadata_cache_misses_total", "counter", {"namespace": namespace}, count
+    yield "metadata_cache_entries", "gauge", {}, stats["entries"]
+    yield "search_cache_hits_total", "counter", {}, search_cache.hits
+    yield "search_cache_misses_total", "counter", {}, search_cache.misses
+    yield "fragment_cache_hits_total", "counter", {}, renderer.fragments.hits
+    yield "fragment_cache_misses_total", "counter", {}, renderer.fragments.misses
+    store = fragment_store.stats()
+    yield "fragment_store_hits_total", "counter", {}, store["hits"]
+    yield "fragment_store_misses_total", "counter", {}, store["misses"]
+    yield "fragment_store_stale_total", "counter", {}, store["stale"]
+    yield "fragment_store_entries", "gauge", {}, store["entries"]
+    yield "export_cache_hits_total", "counter", {}, exporter.hits
+    yield "export_cache_misses_total", "counter", {}, exporter.misses
+    for path, count in email_finalizer.stats.items():
+        yield "email_finalizer_documents_total", "counter", {"path": path}, count
+    with preview_lock:
+        yield "preview_sessions", "gauge", {}, len(preview_sessions)
+    library = library_index.stats()
+    yield "plex_library_titles", "gauge", {}, library["titles"]
+    yield "plex_library_unresolved_titles", "gauge", {}, library["unresolved"]
+
+metrics.add_collector(collect_cache_metrics)
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def index():
@@ -459,5 +767,48 @@ def index():
 def index_alt():
     return render_template("index-alt.html")
 
+def warm_up():
+    """Sets up what the first requests would otherwise pay for.
+
+    Opens keep-alive connections to TMDB and OMDb, reads the SQLite caches and the title
+    index into the page cache and compiles the page templates. The finalizer processes
+    are only started here in "premailer" mode, where every batch needs them.
+    """
+    with metrics.timer("warm_up"):
+        hosts = [TMDB_API_URL] + ([OMDB_API_URL] if OMDB_API_KEY else [])
+        connected = dict(zip(hosts, search_executor.map(api_client.connect, hosts)))
+        metadata_cache.stats()
+        fragment_store.stats()
+        library_index.stats()
+        if title_index is not None:
+            title_index.search("the")
+        for name in ("index.html", "index-alt.html"):
+            app.jinja_env.get_template(name)
+        if email_finalizer.mode == "premailer" and get_finalizer_pool() is not None:
+            finalizer_pool.submit(int).result()
+    logger.info("Warmed up", extra={"fields": {"connected": connected, "title_index": title_index is not None}})
+
+def shutdown():
+    """Stops taking jobs, lets queued and running sends finish, then stops the worker pools.
+
+    Generation jobs are cancelled rather than drained; their results only live in this
+    process and would be lost with it.
+    """
+    logger.info("Shutting down", extra={"fields": {"timeout": SHUTDOWN_TIMEOUT}})
+    unfinished = job_queue.shutdown(timeout=SHUTDOWN_TIMEOUT, cancel_kinds=("generate", "generate_batch", "library"))
+    if unfinished:
+        logger.warning("Jobs still unfinished at shutdown", extra={"fields": {"jobs": [job.id for job in unfinished]}})
+    exporter.shutdown()
+    search_executor.shutdown(cancel_futures=True)
+    if finalizer_pool is not None:
+        finalizer_pool.shutdown(cancel_futures=True)
+    api_client.close()
+
+def create_app():
+    """Returns the app warmed up for serving; see server.py for the production entry point."""
+    warm_up()
+    return app
+
 if __name__ == "__main__":
+    # Development server with the reloader and debugger; use server.py in production
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,459 @@
+"""Offline benchmark for the newsletter app.
+
+Starts a local stub of the TMDB and OMDb APIs that replays recorded responses (with
+optional injected latency and errors) and a local SMTP sink. Then it drives the Flask
+app's /search, /generate (classic and magazine), /generate-batch and /send-email endpoints with
+synthetic issues and reports latency, throughput, peak memory and per-phase timings.
+
+    python bench/benchmark.py                          # run and print the report
+    python bench/benchmark.py --save-baseline bench/baseline.json
+    python bench/benchmark.py --compare bench/baseline.json --threshold 0.2
+    python bench/benchmark.py --record                 # refresh fixtures from the live APIs
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import re
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures.json")
+
+
+class StubApiServer:
+    """Serves TMDB (/tmdb/3/...) and OMDb (/omdb/) responses built from recorded fixtures.
+
+    Each title id gets its own copy of the recorded payload with a distinct id, title
+    and imdb_id. `latency_ms` is added to every response and `error_rate` of requests
+    fail with a 503 so the client's retry path is exercised.
+    """
+
+    def __init__(self, fixtures, latency_ms=0.0, error_rate=0.0, seed=0):
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, handler):
+        with self._lock:
+            self.requests += 1
+            fail = self._random.random() < self.error_rate
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if fail:
+            return self._send(handler, 503, {"status_message": "Injected failure"})
+        url = urlsplit(handler.path)
+        query = parse_qs(url.query)
+        match = re.fullmatch(r"/tmdb/3/(movie|tv)/(\d+)", url.path)
+        if match:
+            return self._send(handler, 200, self.details(match.group(1), int(match.group(2))))
+        match = re.fullmatch(r"/tmdb/3/find/\w*?(\d+)", url.path)
+        if match:
+            return self._send(handler, 200, self.find(int(match.group(1)), query.get("external_source", [""])[0]))
+        match = re.fullmatch(r"/tmdb/3/search/(movie|tv)", url.path)
+        if match:
+            return self._send(handler, 200, self.search(match.group(1), query.get("query", [""])[0]))
+        if url.path.rstrip("/") == "/omdb":
+            return self._send(handler, 200, self.omdb(query.get("i", [""])[0]))
+        self._send(handler, 404, {"status_message": "Not found"})
+
+    def details(self, media_type, tmdb_id):
+        payload = copy.deepcopy(self.fixtures[media_type])
+        payload["id"] = tmdb_id
+        if media_type == "movie":
+            payload["title"] = f"{payload['title']} #{tmdb_id}"
+            payload["imdb_id"] = f"tt{tmdb_id:07d}"
+        else:
+            payload["name"] = f"{payload['name']} #{tmdb_id}"
+        return payload
+
+    def search(self, media_type, query):
+        payload = copy.deepcopy(self.fixtures[f"search_{media_type}"])
+        title_key = "title" if media_type == "movie" else "name"
+        for result in payload["results"]:
+            result[title_key] = f"{query} {result[title_key]}"
+        return payload
+
+    @staticmethod
+    def find(number, external_source):
+        # IMDb ids resolve to movies and TVDB ids to shows, keeping the numeric part as the TMDB id
+        result = [{"id": number}]
+        return {"movie_results": result if external_source == "imdb_id" else [],
+                "tv_results": result if external_source == "tvdb_id" else []}
+
+    def omdb(self, imdb_id):
+        payload = copy.deepcopy(self.fixtures["omdb"])
+        payload["imdbID"] = imdb_id
+        return payload
+
+    @staticmethod
+    def _send(handler, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+class SmtpSink:
+    """Minimal plaintext SMTP server that accepts any login and discards messages after counting them."""
+
+    def __init__(self):
+        sink = self
+        self.messages = 0
+        self._lock = threading.Lock()
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.reply("220 localhost benchmark sink")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode("utf-8", "replace").strip().upper()
+                    if command.startswith("EHLO"):
+                        self.reply("250-localhost", "250-AUTH PLAIN LOGIN", "250 SIZE 104857600")
+                    elif command.startswith("HELO"):
+                        self.reply("250 localhost")
+                    elif command.startswith("AUTH"):
+                        self.reply("235 Authentication successful")
+                    elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                        self.reply("250 OK")
+                    elif command == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        while self.rfile.readline() not in (b".\r\n", b""):
+                            pass
+                        with sink._lock:
+                            sink.messages += 1
+                        self.reply("250 Queued")
+                    elif command == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+            def reply(self, *lines):
+                self.wfile.write("".join(f"{line}\r\n" for line in lines).encode("utf-8"))
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def record_fixtures(path, movie_id=693134, tv_id=1396, query="dune"):
+    """Captures fresh fixture payloads from the live APIs using the keys in the environment."""
+    import requests
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(ROOT, ".env"))
+    tmdb_key, omdb_key = os.environ["TMDB_API_KEY"], os.environ["OMDB_API_KEY"]
+    tmdb = "https://api.themoviedb.org/3"
+    movie = requests.get(f"{tmdb}/movie/{movie_id}", params={"api_key": tmdb_key}, timeout=10).json()
+    fixtures = {
+        "movie": movie,
+        "tv": requests.get(f"{tmdb}/tv/{tv_id}", params={"api_key": tmdb_key}, timeout=10).json(),
+        "omdb": requests.get("https://www.omdbapi.com/", params={"i": movie["imdb_id"], "apikey": omdb_key}, timeout=10).json(),
+        "search_movie": requests.get(f"{tmdb}/search/movie", params={"api_key": tmdb_key, "query": query}, timeout=10).json(),
+        "search_tv": requests.get(f"{tmdb}/search/tv", params={"api_key": tmdb_key, "query": query}, timeout=10).json(),
+    }
+    with open(path, "w") as f:
+        json.dump(fixtures, f, indent=2)
+    print(f"Recorded fixtures to {path}")
+
+
+def synthetic_issue(layout, size):
+    """Builds a /generate payload with `size` titles, alternating movies and TV shows."""
+    items = [{"id": 1000 + i, "type": "movie" if i % 2 == 0 else "tv", "blurb": f"Editor blurb for title {i}."}
+             for i in range(size)]
+    new_items, featured_items = items[:(size + 1) // 2], items[(size + 1) // 2:]
+    data = {"layout": layout, "introText": "Here is what landed on the server this week.\nEnjoy!",
+            "newItems": new_items, "featuredItems": featured_items}
+    if layout == "classic":
+        data["featuredIntroText"] = "Also on the server, check out these library picks!"
+    else:
+        data.update({
+            "featuredNewItem": new_items[0] if new_items else None,
+            "featuredLibraryItem": featured_items[0] if featured_items else None,
+            "newItemsLongform": "A longer editor's note about the featured title.\n" * 5,
+            "libraryPicksLongform": "Why this library pick deserves another look.\n" * 5,
+        })
+    return data
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Benchmark:
+    def __init__(self, newsletter_app, iterations, cold):
+        self.app = newsletter_app
+        self.client = newsletter_app.app.test_client()
+        self.iterations = iterations
+        self.cold = cold
+        self.spans = None
+        newsletter_app.metrics.add_listener(self._record_span)
+
+    def _record_span(self, name, value, labels):
+        if self.spans is not None and name == "newsletter_phase_duration_seconds":
+            self.spans.setdefault(labels["phase"], []).append(value)
+
+    def reset_caches(self):
+        self.app.metadata_cache.clear()
+        self.app.search_cache.clear()
+        self.app.renderer.fragments.clear()
+        self.app.fragment_store.clear()
+        self.app.email_finalizer.clear()
+
+    def wait_for_job(self, job_id):
+        job = self.app.job_queue.get(job_id)
+        version = -1
+        while job.status not in self.app.FINISHED_STATUSES:
+            version = job.wait(version, timeout=60)
+        if job.status != "completed":
+            raise RuntimeError(f"{job.kind} job {job.status}: {job.error}")
+        return job
+
+    def run_scenario(self, name, operation, units=1, cold=None):
+        """Times `operation` over the configured iterations, then measures peak memory in one extra run."""
+        cold = self.cold if cold is None else cold
+        if not cold:
+            operation()  # warm-up so warm runs measure cache hits only
+        self.spans = {}
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(self.iterations):
+            if cold:
+                self.reset_caches()
+            start = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - start)
+        wall = time.perf_counter() - started
+        spans, self.spans = self.spans, None
+
+        if cold:
+            self.reset_caches()
+        tracemalloc.start()
+        operation()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        result = {
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "throughput_per_s": self.iterations * units / wall if wall else 0.0,
+            "peak_memory_mb": peak / (1024 * 1024),
+            "stages": {phase: {"count": len(values), "p50_ms": percentile(values, 50) * 1000,
+                               "p99_ms": percentile(values, 99) * 1000}
+                       for phase, values in sorted(spans.items())},
+        }
+        print_result(name, result)
+        return result
+
+    def search(self):
+        counter = iter(range(10 ** 9))
+
+        def operation():
+            response = self.client.get(f"/search?query=bench{next(counter)}")
+            assert response.status_code == 200, response.json
+        return operation
+
+    def search_cached(self):
+        def operation():
+            response = self.client.get("/search?query=dune")
+            assert response.status_code == 200, response.json
+        return operation
+
+    def generate(self, layout, size):
+        payload = synthetic_issue(layout, size)
+
+        def operation():
+            response = self.client.post("/generate", json=payload)
+            assert response.status_code == 202, response.json
+            self.wait_for_job(response.json["jobId"])
+        return operation
+
+    def generate_batch(self, size, audiences=3):
+        """One /generate-batch call with overlapping issues, as when each audience gets its own cut."""
+        issues = [dict(synthetic_issue(layout, size), name=f"audience{i}")
+                  for i, layout in zip(range(audiences), ("classic", "magazine") * audiences)]
+
+        def operation():
+            response = self.client.post("/generate-batch", json={"issues": issues})
+            assert response.status_code == 202, response.json
+            self.wait_for_job(response.json["jobId"])
+        return operation
+
+    def send(self, count):
+        payload = {"recipients": ", ".join(f"reader{i}@example.com" for i in range(count)),
+                   "subject": "Benchmark issue", "html": "<p>Benchmark newsletter body</p>"}
+
+        def operation():
+            response = self.client.post("/send-email", json=payload)
+            assert response.status_code == 202, response.json
+            job = self.wait_for_job(response.json["jobId"])
+            assert job.result["failed"] == 0, job.result
+        return operation
+
+
+def print_result(name, result):
+    print(f"{name:<24} p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms  "
+          f"{result['throughput_per_s']:9.1f}/s  peak {result['peak_memory_mb']:7.2f} MB")
+    for phase, stats in result["stages"].items():
+        print(f"    {phase:<20} n={stats['count']:<6} p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms")
+
+
+def compare(results, baseline, threshold):
+    """Returns descriptions of scenarios whose p50 or p99 grew by more than `threshold`."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if base[metric] > 0 and result[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {base[metric]:.2f} -> {result[metric]:.2f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="5,50,500", help="issue sizes (titles) and recipient counts")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="latency added to every stub API response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub API requests that fail with 503")
+    parser.add_argument("--warm", action="store_true", help="keep caches between iterations instead of clearing them")
+    parser.add_argument("--scenarios", default="search,generate,batch,send", help="comma-separated subset to run")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before a regression is reported")
+    parser.add_argument("--title-index", help="serve /search from this local title index (see title_index.py)")
+    parser.add_argument("--record", action="store_true", help="re-record fixtures from the live APIs and exit")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(FIXTURES_PATH)
+        return 0
+
+    with open(FIXTURES_PATH) as f:
+        fixtures = json.load(f)
+    stub = StubApiServer(fixtures, latency_ms=args.latency_ms, error_rate=args.error_rate).start()
+    sink = SmtpSink().start()
+    workdir = tempfile.mkdtemp(prefix="newsletter-bench-")
+
+    # The app reads its configuration at import time, so point it at the stubs first
+    os.environ.update({
+        "TMDB_API_URL": f"http://127.0.0.1:{stub.port}/tmdb/3",
+        "OMDB_API_URL": f"http://127.0.0.1:{stub.port}/omdb/",
+        "TMDB_API_KEY": "benchmark", "OMDB_API_KEY": "benchmark",
+        "METADATA_CACHE_PATH": os.path.join(workdir, "metadata_cache.sqlite3"),
+        "IMAGE_CACHE_DIR": os.path.join(workdir, "image_cache"),
+        "FRAGMENT_STORE_PATH": os.path.join(workdir, "fragment_store.sqlite3"),
+        "SMTP_HOST": "127.0.0.1", "SMTP_PORT": str(sink.port), "SMTP_USE_SSL": "false",
+        "GMAIL_USER": "newsletter@example.com", "GMAIL_PASSWORD": "benchmark",
+        "SEARCH_INDEX_PATH": args.title_index or os.path.join(workdir, "title_index.bin"),
+        "MAIL_BATCH_DELAY": "0", "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    os.environ.pop("PUBLIC_BASE_URL", None)
+    sys.path.insert(0, ROOT)
+    import app as newsletter_app
+
+    benchmark = Benchmark(newsletter_app, args.iterations, cold=not args.warm)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    scenarios = set(args.scenarios.split(","))
+    results = {}
+    try:
+        if "search" in scenarios:
+            results["search"] = benchmark.run_scenario("search", benchmark.search())
+            results["search_cached"] = benchmark.run_scenario("search_cached", benchmark.search_cached(), cold=False)
+        if "generate" in scenarios:
+            for layout in ("classic", "magazine"):
+                for size in sizes:
+                    name = f"generate_{layout}_{size}"
+                    results[name] = benchmark.run_scenario(name, benchmark.generate(layout, size), units=size)
+        if "batch" in scenarios:
+            for size in sizes:
+                name = f"generate_batch_{size}"
+                results[name] = benchmark.run_scenario(name, benchmark.generate_batch(size), units=size)
+        if "send" in scenarios:
+            for size in sizes:
+                results[f"send_{size}"] = benchmark.run_scenario(f"send_{size}", benchmark.send(size), units=size)
+    finally:
+        stub.stop()
+        sink.stop()
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"iterations": args.iterations, "latency_ms": args.latency_ms, "error_rate": args.error_rate,
+                   "cold": not args.warm, "python": sys.version.split()[0]},
+        "upstream_requests": stub.requests,
+        "emails_delivered": sink.messages,
+        "results": results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Wrote {path}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for key in ("latency_ms", "error_rate", "cold"):
+            if baseline.get("config", {}).get(key) != report["config"][key]:
+                print(f"Warning: baseline was recorded with {key}={baseline['config'].get(key)}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from premailer import transform
+
+NEEDS_INLINING = re.compile(r"<style\b|<link\b[^>]*\bstylesheet\b|\sclass\s*=", re.I)
+IMG_TAG = re.compile(r"<img\b[^>]*>", re.I)
+STYLE_ATTR = re.compile(r"""\sstyle\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.I)
+ALIGN_ATTR = re.compile(r"\salign\s*=", re.I)
+FLOAT_RULE = re.compile(r"(?:^|;)\s*float\s*:\s*(left|right)\b", re.I)
+
+
+def needs_inlining(html):
+    """Returns True if the document has stylesheets or classes that premailer would need to inline."""
+    return bool(NEEDS_INLINING.search(html))
+
+
+def align_floating_images(html):
+    """Adds align="left|right" to floated images, mirroring premailer's align_floating_images."""
+    def add_align(match):
+        tag = match.group(0)
+        style = STYLE_ATTR.search(tag)
+        if not style or ALIGN_ATTR.search(tag):
+            return tag
+        floated = FLOAT_RULE.search(style.group(1) if style.group(1) is not None else style.group(2))
+        if not floated:
+            return tag
+        end = len(tag) - 2 if tag.endswith("/>") else len(tag) - 1
+        return f'{tag[:end].rstrip()} align="{floated.group(1).lower()}"{tag[end:]}'
+
+    return IMG_TAG.sub(add_align, html)
+
+
+def finalize_document(html, mode="fast"):
+    """Makes one document email-ready without caching and returns (path, html).
+
+    Module-level and stateless so it can run in a worker process.
+    """
+    if mode == "fast" and not needs_inlining(html):
+        return "fast", align_floating_images(html).strip()
+    return "premailer", transform(html)
+
+
+class EmailFinalizer:
+    """Final "make it email-ready" stage for rendered newsletters.
+
+    Our renderers already emit inline styles only, so in "fast" mode a document without
+    <style> blocks, stylesheet links or class attributes skips premailer's parse/cssutils
+    pass and only gets the one attribute premailer would add (align on floated images).
+    Anything else, or "premailer" mode, goes through premailer.transform. Finalized
+    documents are memoized by content hash, so re-rendering an unchanged preview is free.
+    """
+
+    def __init__(self, mode="fast", cache_size=32):
+        self.mode = mode
+        self.cache_size = cache_size
+        self.stats = {"fast": 0, "premailer": 0, "cache_hits": 0}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def finalize(self, html):
+        return self.finalize_many([html])[0]
+
+    def finalize_many(self, documents, executor=None):
+        """Finalizes several documents, each distinct one once.
+
+        Documents missing from the cache that need premailer are spread over `executor`
+        (e.g. a process pool, since premailer is CPU-bound) when there is more than one of
+        them. `executor` may also be a function returning one (or None), called only then,
+        so a pool can be started on first use. Fast-path documents are cheaper to finalize than to ship to
+        another process, so they always stay in-process.
+        """
+        keys = [hashlib.sha256(html.encode("utf-8")).hexdigest() for html in documents]
+        results = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    self.stats["cache_hits"] += 1
+                    results[key] = self._cache[key]
+        pending = {key: html for key, html in zip(keys, documents) if key not in results}
+        heavy = {key: html for key, html in pending.items() if self.mode != "fast" or needs_inlining(html)}
+        futures = {}
+        if executor is not None and len(heavy) > 1:
+            if callable(executor):
+                executor = executor()
+            if executor is not None:
+                futures = {key: executor.submit(finalize_document, html, self.mode) for key, html in heavy.items()}
+        finished = {key: finalize_document(html, self.mode) for key, html in pending.items() if key not in futures}
+        finished.update((key, future.result()) for key, future in futures.items())
+        with self._lock:
+            for key, (path, result) in finished.items():
+                self.stats[path] += 1
+                self._cache[key] = result
+                results[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return [results[key] for key in keys]
@@ -0,0 +1,218 @@
+import hashlib
+import io
+import logging
+import math
+import os
+import queue
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from instrumentation import metrics
+
+try:
+    from playwright.sync_api import sync_playwright
+except ImportError:  # Playwright is optional; without it server-side export is unavailable
+    sync_playwright = None
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it tall PNGs are captured in one piece
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"png": "image/png", "pdf": "application/pdf"}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class PngStreamWriter:
+    """Writes an RGB PNG row block by row block, so a tall image never has to be held in memory."""
+
+    def __init__(self, f, width, height):
+        self.f = f
+        self.width = width
+        self._compressor = zlib.compressobj(6)
+        f.write(PNG_SIGNATURE)
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def write_rows(self, pixels):
+        """Appends raw RGB rows (width * 3 bytes each), unfiltered."""
+        stride = self.width * 3
+        rows = b"".join(b"\0" + pixels[i:i + stride] for i in range(0, len(pixels), stride))
+        data = self._compressor.compress(rows)
+        if data:
+            self._chunk(b"IDAT", data)
+
+    def close(self):
+        self._chunk(b"IDAT", self._compressor.flush())
+        self._chunk(b"IEND", b"")
+
+    def _chunk(self, kind, data):
+        self.f.write(struct.pack(">I", len(data)) + kind + data)
+        self.f.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+
+class DocumentExporter:
+    """Renders finished newsletters to PNG or PDF with headless Chromium.
+
+    Each of the `workers` threads owns one browser and takes exports from a shared queue.
+    Results are cached on disk by a hash of the document and export settings, and
+    identical exports already in flight are shared. PNGs taller than `tile_height` CSS
+    pixels are captured as tiles and streamed into a single image.
+
+    The HTML comes from the client, so pages run with JavaScript off and the only requests
+    they may make are for images whose URL starts with one of `image_sources`; everything
+    else is aborted. Allowed images are served through `fetch` and kept in a small
+    in-memory LRU, so repeated exports don't download the same posters again.
+    """
+
+    def __init__(self, cache_dir, workers=2, width=700, scale=2, tile_height=4000, timeout=30,
+                 fetch=None, image_cache_size=256, image_sources=("https://image.tmdb.org/",)):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.width = width
+        self.scale = scale
+        self.tile_height = tile_height
+        self.timeout = timeout
+        self.fetch = fetch
+        self.image_cache_size = image_cache_size
+        self.image_sources = tuple(image_sources)
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._tasks = queue.Queue()
+        self._threads = []
+
+    @property
+    def available(self):
+        return sync_playwright is not None
+
+    def export(self, html, fmt):
+        """Returns the path of the exported file, rendering it on a worker unless it is cached."""
+        key = hashlib.sha256(f"{fmt}:{self.width}:{self.scale}:{html}".encode("utf-8")).hexdigest()
+        path = os.path.join(self.cache_dir, key[:2], f"{key}.{fmt}")
+        with self._lock:
+            if os.path.exists(path):
+                self.hits += 1
+                return path
+            self.misses += 1
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = Future()
+                self._start_workers()
+                self._tasks.put((html, fmt, path, future))
+        try:
+            return future.result(timeout=self.timeout * 4)
+        finally:
+            with self._lock:
+                if self._pending.get(key) is future and future.done():
+                    del self._pending[key]
+
+    def shutdown(self):
+        """Stops the workers after the exports already queued; each closes its own browser."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._tasks.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"exporter-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        # Playwright's sync API is bound to the thread that started it
+        playwright = browser = None
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    return
+                html, fmt, path, future = task
+                try:
+                    if browser is None:
+                        playwright = sync_playwright().start()
+                        browser = playwright.chromium.launch()
+                    with metrics.timer("export", format=fmt):
+                        self._render(browser, html, fmt, path)
+                    future.set_result(path)
+                except Exception as e:
+                    logger.exception("Export failed", extra={"fields": {"format": fmt}})
+                    future.set_exception(e)
+        finally:
+            if browser is not None:
+                browser.close()
+                playwright.stop()
+
+    def _render(self, browser, html, fmt, path):
+        context = browser.new_context(viewport={"width": self.width, "height": self.tile_height},
+                                      device_scale_factor=self.scale, java_script_enabled=False)
+        try:
+            page = context.new_page()
+            page.set_default_timeout(self.timeout * 1000)
+            page.route("**/*", self._serve_image)
+            page.set_content(html, wait_until="networkidle")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            if fmt == "pdf":
+                page.pdf(path=temp_path, width=f"{self.width}px", print_background=True)
+            else:
+                height = math.ceil(page.locator("html").bounding_box()["height"])
+                if height <= self.tile_height or Image is None:
+                    page.screenshot(path=temp_path, full_page=True)
+                else:
+                    self._write_tiles(page, height, temp_path)
+            # Rename into place so concurrent readers never see a partial export
+            os.replace(temp_path, path)
+        finally:
+            context.close()
+
+    def _write_tiles(self, page, height, path):
+        """Captures the page in tile_height slices and streams them into one PNG."""
+        width_px = round(self.width * self.scale)
+        with open(path, "wb") as f:
+            writer = PngStreamWriter(f, width_px, round(height * self.scale))
+            written = 0
+            for top in range(0, height, self.tile_height):
+                bottom = min(top + self.tile_height, height)
+                shot = page.screenshot(clip={"x": 0, "y": top, "width": self.width, "height": bottom - top}, full_page=True)
+                rows = round(bottom * self.scale) - written
+                tile = Image.open(io.BytesIO(shot)).convert("RGB").crop((0, 0, width_px, rows))
+                writer.write_rows(tile.tobytes())
+                written += rows
+            writer.close()
+
+    def _serve_image(self, route):
+        request = route.request
+        if request.resource_type != "image" or not request.url.startswith(self.image_sources):
+            route.abort()
+            return
+        if self.fetch is None:
+            route.continue_()
+            return
+        with self._lock:
+            cached = self._images.get(request.url)
+            if cached is not None:
+                self._images.move_to_end(request.url)
+        if cached is None:
+            try:
+                response = self.fetch(request.url)
+                response.raise_for_status()
+            except Exception as e:
+                logger.warning("Could not fetch image for export", extra={"fields": {"url": request.url, "error": e}})
+                route.abort()
+                return
+            cached = (response.content, response.headers.get("Content-Type", "image/jpeg"))
+            with self._lock:
+                self._images[request.url] = cached
+                while len(self._images) > self.image_cache_size:
+                    self._images.popitem(last=False)
+        route.fulfill(body=cached[0], content_type=cached[1])
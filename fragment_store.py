@@ -0,0 +1,78 @@
+import sqlite3
+import threading
+import time
+
+
+class FragmentStore:
+    """SQLite-backed store of finished, email-ready card fragments shared across issues.
+
+    There is one row per title and card variant, tagged with the version hash of
+    everything the fragment was rendered from (TMDB/OMDb details, blurb, extra arguments,
+    template and poster settings). A lookup with a different version is a miss, and the
+    re-rendered fragment replaces the stale row. Past max_entries, the least recently
+    used rows are evicted. Their use time is refreshed at most once per `touch_interval`,
+    so hits stay read-only.
+    """
+
+    def __init__(self, path, max_entries=20000, touch_interval=86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fragments ("
+            " title TEXT NOT NULL, variant TEXT NOT NULL, version TEXT NOT NULL, html TEXT NOT NULL,"
+            " used_at REAL NOT NULL, PRIMARY KEY (title, variant))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fragments_used ON fragments (used_at)")
+        self._conn.commit()
+
+    def get(self, title, variant, version):
+        """Returns the stored fragment if it was rendered from the same version, else None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, html, used_at FROM fragments WHERE title = ? AND variant = ?", (title, variant)
+            ).fetchone()
+            if row is None or row[0] != version:
+                self.misses += 1
+                if row is not None:
+                    self.stale += 1
+                return None
+            if now - row[2] > self.touch_interval:
+                self._conn.execute(
+                    "UPDATE fragments SET used_at = ? WHERE title = ? AND variant = ?", (now, title, variant)
+                )
+                self._conn.commit()
+            self.hits += 1
+            return row[1]
+
+    def put(self, title, variant, version, html):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fragments (title, variant, version, html, used_at) VALUES (?, ?, ?, ?, ?)",
+                (title, variant, version, html, time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM fragments").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM fragments WHERE rowid IN"
+                    " (SELECT rowid FROM fragments ORDER BY used_at ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def clear(self):
+        """Drops every fragment (the hit/miss counters keep counting)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM fragments")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM fragments").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "stale": self.stale, "entries": count}
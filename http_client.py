@@ -0,0 +1,117 @@
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Client-side rate limiter allowing `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, then consumes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HttpClient:
+    """Shared outbound HTTP client with keep-alive pools, timeouts, retries and rate limiting.
+
+    One requests.Session is reused for every call, so connections to each upstream host
+    stay open between requests. Connection errors, timeouts and 429/5xx responses are
+    retried with jittered exponential backoff, honoring any Retry-After header.
+    """
+
+    def __init__(self, timeout=(3.05, 10), max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 pool_size=10, pool_hosts=8, rate_limits=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiters = {host: TokenBucket(rate) for host, rate in (rate_limits or {}).items() if rate}
+        self.session = requests.Session()
+        # One pool per upstream host (TMDB, OMDb, TMDB's image host, ...); too few and urllib3
+        # closes a pool whenever another host is used
+        adapter = HTTPAdapter(pool_connections=max(pool_hosts, len(self.limiters)), pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, params=None):
+        """Performs a GET, retrying transient failures. Returns the final response."""
+        host = urlsplit(url).hostname
+        limiter = self.limiters.get(host)
+        attempt = 0
+        while True:
+            if limiter:
+                limiter.acquire()
+            if attempt:
+                metrics.inc("upstream_retries_total", host=host)
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                metrics.inc("upstream_requests_total", host=host, status="error")
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                metrics.inc("upstream_requests_total", host=host, status=response.status_code)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    time.sleep(min(retry_after, self.backoff_max))
+                    attempt += 1
+                    continue
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def connect(self, url):
+        """Opens a pooled keep-alive connection to the url's host, so the first real request skips DNS and TLS setup."""
+        try:
+            self.session.head(url, timeout=self.timeout).close()
+        except requests.RequestException:
+            return False
+        return True
+
+    def _backoff(self, attempt):
+        # "Full jitter": a random delay up to the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def close(self):
+        self.session.close()
+
+
+def _parse_retry_after(value):
+    """Returns the Retry-After delay in seconds, accepting both delta-seconds and HTTP dates."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
@@ -0,0 +1,117 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it posters are cached at TMDB's nearest size
+    Image = None
+
+# Display sizes (width, height) used by the card templates
+POSTER_SIZES = {
+    "card": (150, 225),
+    "small": (60, 90),
+    "featured": (200, 300),
+}
+TMDB_WIDTHS = (92, 154, 185, 342, 500, 780)
+TMDB_SIZE_SEGMENT = re.compile(r"/t/p/(w\d+|original)/")
+FORMATS = {"jpeg": ("image/jpeg", "JPEG"), "webp": ("image/webp", "WEBP")}
+
+
+def tmdb_sized_url(url, width):
+    """Rewrites a TMDB image URL to the smallest size at least `width` pixels wide."""
+    size = next((w for w in TMDB_WIDTHS if w >= width), None)
+    segment = f"/t/p/w{size}/" if size else "/t/p/original/"
+    return TMDB_SIZE_SEGMENT.sub(segment, url, count=1)
+
+
+class PosterCache:
+    """Resizes and recompresses poster images into a content-addressed disk cache.
+
+    poster_url() is called while rendering: it only derives the cache key from the source
+    URL and target size and records how to build the image, so rendering stays fast.
+    The image itself is fetched, cropped to the exact display size (times `scale` for
+    high-DPI screens) and recompressed the first time /img/<key> is requested.
+    Without a public base URL the posters can't be served to email recipients, so
+    poster_url() just points at TMDB's nearest smaller rendition instead.
+    """
+
+    def __init__(self, cache_dir, fetch, base_url=None, scale=2, image_format="jpeg", quality=80):
+        self.cache_dir = cache_dir
+        self.fetch = fetch
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.scale = scale
+        self.image_format = image_format if image_format in FORMATS else "jpeg"
+        self.quality = quality
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def poster_url(self, url, variant):
+        if not url or variant not in POSTER_SIZES:
+            return url
+        width, height = POSTER_SIZES[variant]
+        if not self.base_url:
+            return tmdb_sized_url(url, width * self.scale)
+        spec = {"url": url, "width": width * self.scale, "height": height * self.scale,
+                "format": self.image_format, "quality": self.quality}
+        key = hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+        spec_path = self._path(key, "json")
+        if not os.path.exists(spec_path):
+            self._write(spec_path, json.dumps(spec).encode("utf-8"))
+        return f"{self.base_url}/img/{key}"
+
+    def has_images(self, html):
+        """Returns True if every /img/<key> poster that `html` links to can still be served from this cache."""
+        if not self.base_url:
+            return True
+        keys = re.findall(rf"{re.escape(self.base_url)}/img/([0-9a-f]{{32}})", html)
+        return all(os.path.exists(self._path(key, "json")) for key in keys)
+
+    def load(self, key):
+        """Returns (bytes, mimetype) for a cached poster, building it on first use, or None if unknown."""
+        if not re.fullmatch(r"[0-9a-f]{32}", key):
+            return None
+        spec_path = self._path(key, "json")
+        if not os.path.exists(spec_path):
+            return None
+        with open(spec_path) as f:
+            spec = json.load(f)
+        image_path = self._path(key, "img")
+        if not os.path.exists(image_path):
+            self._write(image_path, self._build(spec))
+        with open(image_path, "rb") as f:
+            data = f.read()
+        mimetype = FORMATS[spec["format"]][0] if Image is not None else _sniff_mimetype(data)
+        return data, mimetype
+
+    def _build(self, spec):
+        response = self.fetch(tmdb_sized_url(spec["url"], spec["width"]))
+        response.raise_for_status()
+        if Image is None:
+            return response.content
+        image = Image.open(io.BytesIO(response.content)).convert("RGB")
+        image = ImageOps.fit(image, (spec["width"], spec["height"]), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, FORMATS[spec["format"]][1], quality=spec["quality"], optimize=True)
+        return output.getvalue()
+
+    def _path(self, key, extension):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{extension}")
+
+    def _write(self, path, data):
+        # Write to a temp file and rename so concurrent requests never see a partial image
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+
+def _sniff_mimetype(data):
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
@@ -0,0 +1,153 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records as "time LEVEL logger: message key=value ..." or as one JSON object per line.
+
+    Structured fields are passed through logging's `extra` as {"fields": {...}}.
+    """
+
+    def __init__(self, json_output=False):
+        super().__init__()
+        self.json_output = json_output
+
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+        if self.json_output:
+            entry = {"ts": timestamp, "level": record.levelname, "logger": record.name,
+                     "msg": record.getMessage(), **fields}
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        line = f"{timestamp} {record.levelname} {record.name}: {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(level="INFO", log_format="text"):
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(json_output=log_format == "json"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+
+class Metrics:
+    """Minimal in-process metrics registry rendered in the Prometheus text format.
+
+    Counters and histograms are keyed by name and labels. Collectors are callables
+    run at scrape time that yield (name, type, labels, value) samples, which is how
+    cache hit/miss counters owned by other objects are exported.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+        for listener in self._listeners:
+            listener(name, value, labels)
+
+    @contextmanager
+    def timer(self, phase, **fields):
+        """Times a phase into newsletter_phase_duration_seconds and logs the span at debug level."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("newsletter_phase_duration_seconds", elapsed, phase=phase)
+            logger.debug("span", extra={"fields": {"phase": phase, "ms": round(elapsed * 1000, 2), **fields}})
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def add_listener(self, listener):
+        """Registers listener(name, value, labels), called with every raw histogram observation."""
+        self._listeners.append(listener)
+
+    def render(self):
+        lines = []
+        typed = set()
+
+        def header(name, metric_type):
+            if name not in typed:
+                typed.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(value, buckets=list(value["buckets"]))) for key, value in self._histograms.items())
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception:
+                logger.exception("Metrics collector failed")
+                continue
+            for name, metric_type, labels, value in samples:
+                header(name, metric_type)
+                lines.append(f"{name}{_labels(_label_key(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+metrics = Metrics()
+metrics.describe("newsletter_phase_duration_seconds", "Time spent per phase (upstream fetches, rendering, inlining, SMTP).")
+metrics.describe("upstream_requests_total", "Outbound HTTP requests by host and status.")
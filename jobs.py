@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = {"completed", "failed", "cancelled"}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work function once cancellation has been requested."""
+
+
+class QueueClosed(Exception):
+    """Raised by JobQueue.submit once the queue has started shutting down."""
+
+
+class Job:
+    """A unit of background work with a status, per-phase progress and an optional result."""
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.phase = None
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.version = 0
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def report(self, phase, done=0, total=0):
+        """Records progress for the current phase; raises JobCancelled if the job was cancelled."""
+        if self.cancelled:
+            raise JobCancelled()
+        self._update(phase=phase, done=done, total=total)
+
+    def wait(self, version, timeout=None):
+        """Blocks until the job changes past `version` (or timeout) and returns the new version."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def _update(self, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._changed.notify_all()
+
+    def to_dict(self, include_result=True):
+        data = {
+            "id": self.id, "kind": self.kind, "status": self.status,
+            "phase": self.phase, "done": self.done, "total": self.total,
+            "error": self.error, "createdAt": self.created_at, "finishedAt": self.finished_at,
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobQueue:
+    """In-process job table backed by a worker pool.
+
+    Work functions are called as fn(*args, job=job, **kwargs) and report progress through
+    job.report(). Finished jobs are kept for `retention` seconds so clients can poll them.
+    """
+
+    def __init__(self, max_workers=4, retention=3600):
+        self.retention = retention
+        self.jobs = {}
+        self.closed = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, kind, fn, *args, **kwargs):
+        job = Job(kind)
+        with self._lock:
+            if self.closed:
+                raise QueueClosed()
+            self._prune()
+            self.jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Requests cancellation; running jobs stop at their next progress report."""
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED_STATUSES:
+            job._cancel.set()
+            if job.status == "queued":
+                job._update(status="cancelled", finished_at=time.time())
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            return
+        job._update(status="running")
+        metrics.inc("jobs_total", kind=job.kind)
+        try:
+            result = fn(*args, job=job, **kwargs)
+            job._update(status="completed", result=result, finished_at=time.time())
+            metrics.observe("job_duration_seconds", job.finished_at - job.created_at, kind=job.kind)
+        except JobCancelled:
+            job._update(status="cancelled", finished_at=time.time())
+        except Exception as e:
+            logger.exception("Job failed", extra={"fields": {"kind": job.kind, "job": job.id}})
+            job._update(status="failed", error=str(e), finished_at=time.time())
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def shutdown(self, wait=True, timeout=None, cancel_kinds=()):
+        """Stops taking jobs and cancels those of `cancel_kinds`.
+
+        With `wait`, the remaining queued and running jobs get up to `timeout` seconds to
+        finish. Returns the jobs that are still unfinished.
+        """
+        with self._lock:
+            self.closed = True
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            if job.kind in cancel_kinds:
+                self.cancel(job.id)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in jobs if wait else ():
+            version = job.version
+            while job.status not in FINISHED_STATUSES:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                version = job.wait(version, remaining)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        return [job for job in jobs if job.status not in FINISHED_STATUSES]
@@ -0,0 +1,141 @@
+import smtplib
+import time
+from email.message import EmailMessage
+from email.utils import formataddr, getaddresses
+
+from instrumentation import metrics
+
+
+def parse_recipients(recipients):
+    """Parses a comma/semicolon separated string (or a list) of addresses into unique (address, To header) pairs.
+
+    Display names are kept for the To header ("Jane Doe <jane@example.com>"); duplicates are
+    detected on the address alone.
+    """
+    if isinstance(recipients, str):
+        recipients = [recipients]
+    parsed, seen = [], set()
+    for name, address in getaddresses(recipients):
+        address = address.strip()
+        if address and address.lower() not in seen:
+            seen.add(address.lower())
+            parsed.append((address, formataddr((name, address))))
+    return parsed
+
+
+def is_transient(error):
+    """Returns True for SMTP errors worth retrying: dropped connections and 4xx replies."""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return False
+
+
+class BulkMailer:
+    """Delivers newsletters one message per recipient over a reused SMTP connection.
+
+    Each delivery holds a single authenticated connection for all of its messages.
+    Messages go out in batches with a pause between them to stay under provider
+    sending limits, and transient failures are retried per recipient.
+    """
+
+    def __init__(self, host, port, username, password, batch_size=50, batch_delay=1.0,
+                 max_retries=3, retry_delay=2.0, timeout=30, use_ssl=True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.use_ssl = use_ssl
+
+    def deliver(self, recipients, subject, html_content, job=None):
+        """Sends the newsletter to every recipient and returns a per-recipient report.
+
+        When run as a background job, progress is reported as the "deliver" phase and the
+        report is exposed as the job result while sending, so a cancelled or failed job
+        still shows who was reached.
+        """
+        parsed = parse_recipients(recipients)
+        addresses = [address for address, _ in parsed]
+        report = {
+            "total": len(addresses), "sent": 0, "failed": 0,
+            "recipients": {address: {"status": "pending", "attempts": 0, "error": None} for address in addresses},
+        }
+        if job is not None:
+            job.result = report
+        msg = self._build_message(subject, html_content)
+        smtp = None
+        try:
+            for index, (address, to_header) in enumerate(parsed):
+                if job is not None:
+                    job.report("deliver", index, len(addresses))
+                if index and index % self.batch_size == 0:
+                    time.sleep(self.batch_delay)
+                result = report["recipients"][address]
+                smtp = self._deliver(smtp, msg, address, to_header, result)
+                report[result["status"]] += 1
+            if job is not None:
+                job.report("deliver", len(addresses), len(addresses))
+        finally:
+            if smtp is not None:
+                try:
+                    smtp.quit()
+                except smtplib.SMTPException:
+                    pass
+        return report
+
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = smtp_class(self.host, self.port, timeout=self.timeout)
+        smtp.login(self.username, self.password)
+        return smtp
+
+    def _build_message(self, subject, html_content):
+        msg = EmailMessage()
+        msg['Subject'] = subject
+        msg['From'] = self.username
+        msg.set_content("This is a fallback for email clients that do not support HTML.")
+        msg.add_alternative(html_content, subtype='html')
+        return msg
+
+    def _deliver(self, smtp, msg, address, to_header, result):
+        """Sends to one recipient, reconnecting and retrying on transient errors. Returns the live connection."""
+        del msg['To']
+        msg['To'] = to_header
+        while True:
+            result["attempts"] += 1
+            if smtp is None:
+                # Connection and login failures affect every recipient, so they abort the job once retries run out
+                try:
+                    with metrics.timer("smtp_connect"):
+                        smtp = self._connect()
+                except smtplib.SMTPAuthenticationError:
+                    raise
+                except (smtplib.SMTPException, OSError):
+                    if result["attempts"] > self.max_retries:
+                        raise
+                    time.sleep(self.retry_delay * result["attempts"])
+                    continue
+            try:
+                with metrics.timer("smtp_send"):
+                    smtp.send_message(msg, to_addrs=[address])
+                metrics.inc("emails_total", status="sent")
+                result["status"] = "sent"
+                result["error"] = None
+                return smtp
+            except (smtplib.SMTPException, OSError) as e:
+                if isinstance(e, smtplib.SMTPServerDisconnected) or not isinstance(e, smtplib.SMTPException):
+                    smtp = None
+                if not is_transient(e) or result["attempts"] > self.max_retries:
+                    metrics.inc("emails_total", status="failed")
+                    result["status"] = "failed"
+                    result["error"] = str(e)
+                    return smtp
+                time.sleep(self.retry_delay * result["attempts"])
@@ -0,0 +1,124 @@
+import json
+import sqlite3
+import threading
+import time
+
+MISS = object()
+
+
+class MetadataCache:
+    """SQLite-backed cache for normalized TMDB details and OMDb Tomatometer scores.
+
+    Entries are stored per namespace ("tmdb" keyed by "<type>:<id>", "omdb" keyed by
+    imdb_id) with their own TTLs. A stored value of None is a negative entry, e.g.
+    "OMDb has no Rotten Tomatoes score for this title". Once the table grows past
+    max_entries, the least recently used rows are evicted. Their use time is refreshed
+    at most once per `touch_interval`, so hits stay read-only.
+    """
+
+    def __init__(self, path, tmdb_ttl=86400, omdb_ttl=604800, negative_ttl=86400, max_entries=5000,
+                 touch_interval=3600):
+        self.path = path
+        self.ttls = {"tmdb": tmdb_ttl, "omdb": omdb_ttl}
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.hits = {"tmdb": 0, "omdb": 0}
+        self.misses = {"tmdb": 0, "omdb": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, payload TEXT,"
+            " stored_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._conn.commit()
+
+    def get(self, namespace, key):
+        """Returns the cached value, or MISS when absent or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, stored_at, accessed_at FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, str(key)),
+            ).fetchone()
+            if row is not None:
+                payload, stored_at, accessed_at = row
+                ttl = self.ttls[namespace] if payload is not None else self.negative_ttl
+                if now - stored_at < ttl:
+                    if now - accessed_at > self.touch_interval:
+                        self._conn.execute(
+                            "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                            (now, namespace, str(key)),
+                        )
+                        self._conn.commit()
+                    self.hits[namespace] += 1
+                    return json.loads(payload) if payload is not None else None
+            self.misses[namespace] += 1
+            return MISS
+
+    def set(self, namespace, key, value):
+        """Stores a value (None for a negative entry) and evicts old rows past the size bound."""
+        now = time.time()
+        payload = json.dumps(value) if value is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, payload, stored_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (namespace, str(key), payload, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE rowid IN"
+                " (SELECT rowid FROM entries ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self):
+        """Drops every entry (the hit/miss counters keep counting)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def get_tmdb(self, item_type, tmdb_id):
+        return self.get("tmdb", f"{item_type}:{tmdb_id}")
+
+    def set_tmdb(self, item_type, tmdb_id, details):
+        self.set("tmdb", f"{item_type}:{tmdb_id}", details)
+
+    def peek_tmdb(self, titles):
+        """Returns {(type, id): details} for the (type, id) pairs that have stored details.
+
+        Read-only: expiry is ignored and neither the use time nor the hit/miss counters
+        change, so it is cheap enough for lookups that only want to display what is known.
+        """
+        keys = {f"{item_type}:{tmdb_id}": (item_type, tmdb_id) for item_type, tmdb_id in titles}
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, payload FROM entries WHERE namespace = 'tmdb' AND payload IS NOT NULL"
+                f" AND key IN ({', '.join('?' * len(keys))})",
+                list(keys),
+            ).fetchall()
+        return {keys[key]: json.loads(payload) for key, payload in rows}
+
+    def get_omdb(self, imdb_id):
+        return self.get("omdb", imdb_id)
+
+    def set_omdb(self, imdb_id, score):
+        self.set("omdb", imdb_id, score)
+
+    def stats(self):
+        """Returns hit/miss counters and the current entry count."""
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+            return {"hits": dict(self.hits), "misses": dict(self.misses), "entries": count}
@@ -0,0 +1,306 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+# Plex agents record external ids as GUIDs, e.g. "tmdb://603", "imdb://tt0133093" or the
+# legacy "com.plexapp.agents.themoviedb://603?lang=en"
+GUID_PATTERN = re.compile(r"^(?:com\.plexapp\.agents\.)?(themoviedb|tmdb|imdb|thetvdb|tvdb)://([^?/]+)")
+GUID_FIELDS = {"themoviedb": "tmdb_id", "tmdb": "tmdb_id", "imdb": "imdb_id", "thetvdb": "tvdb_id", "tvdb": "tvdb_id"}
+PLEX_TYPES = {"movie": "movie", "show": "tv", "episode": "episode"}
+# metadata_items.metadata_type in the Plex database
+DB_TYPES = {1: "movie", 2: "tv"}
+DB_EPISODE = 4
+DB_GUID_TAG = 314
+EXPORT_EXTENSIONS = (".xml", ".json")
+DATABASE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+
+def parse_guids(guids):
+    """Maps Plex GUID strings onto {"tmdb_id", "imdb_id", "tvdb_id"}, ignoring Plex's own plex:// ids."""
+    ids = {}
+    for guid in guids:
+        match = GUID_PATTERN.match(guid or "")
+        if match:
+            ids.setdefault(GUID_FIELDS[match.group(1)], match.group(2))
+    return ids
+
+
+def to_timestamp(value):
+    """Plex stores dates as epoch seconds, or as "YYYY-MM-DD HH:MM:SS" in older databases."""
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.strptime(str(value)[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+
+
+def _entry(attrs, guids):
+    kind = PLEX_TYPES.get(attrs.get("type"))
+    if kind is None or not attrs.get("ratingKey"):
+        return None
+    added_at = to_timestamp(attrs.get("addedAt"))
+    return {
+        "key": str(attrs["ratingKey"]), "type": kind, "title": attrs.get("title"),
+        "year": int(attrs["year"]) if str(attrs.get("year") or "").isdigit() else None,
+        "added_at": added_at, "updated_at": to_timestamp(attrs.get("updatedAt")) or added_at,
+        "show_key": str(attrs["grandparentRatingKey"]) if attrs.get("grandparentRatingKey") else None,
+        **parse_guids([attrs.get("guid")] + list(guids)),
+    }
+
+
+def read_xml_export(path):
+    """Yields entries from a saved Plex library XML response (/library/sections/<id>/all)."""
+    for _, element in ET.iterparse(path):
+        if element.tag in ("Video", "Directory"):
+            entry = _entry(element.attrib, [guid.get("id") for guid in element.iter("Guid")])
+            if entry:
+                yield entry
+            element.clear()
+
+
+def read_json_export(path):
+    """Yields entries from a saved Plex library JSON response, or a bare list of its Metadata items."""
+    with open(path) as f:
+        data = json.load(f)
+    items = data.get("MediaContainer", {}).get("Metadata", []) if isinstance(data, dict) else data
+    for item in items:
+        entry = _entry(item, [guid.get("id") for guid in item.get("Guid", [])])
+        if entry:
+            yield entry
+
+
+class LibraryIndex:
+    """Local index of the titles in a Plex library, built from exports or a copy of its database.
+
+    Each scanned source is remembered with a signature (size and mtime), so unchanged
+    sources are skipped. Changed exports are diffed against the stored rows, and a Plex
+    database is queried only for rows updated since the last scan. `latest_at` is when a
+    title last gained content: its own added date for movies, the newest episode for shows.
+    """
+
+    def __init__(self, path, resolve_retry=86400):
+        self.path = path
+        self.resolve_retry = resolve_retry
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS titles ("
+            " source TEXT NOT NULL, key TEXT NOT NULL, type TEXT NOT NULL, title TEXT, year INTEGER,"
+            " tmdb_id INTEGER, imdb_id TEXT, tvdb_id TEXT, added_at REAL, updated_at REAL,"
+            " latest_at REAL, lookup_at REAL, PRIMARY KEY (source, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS titles_latest ON titles (latest_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            " source TEXT PRIMARY KEY, signature TEXT, high_water REAL, scanned_at REAL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS marks (name TEXT PRIMARY KEY, value REAL)")
+        self._conn.commit()
+
+    def scan(self, sources):
+        """Brings the index up to date with every export file, export directory or database in `sources`."""
+        stats = {"scanned": 0, "skipped": 0, "upserted": 0, "removed": 0}
+        for path in self._expand(sources):
+            signature = self._signature(path)
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT signature, high_water FROM sources WHERE source = ?", (path,)
+                ).fetchone()
+            if row and row[0] == signature:
+                stats["skipped"] += 1
+                continue
+            if path.endswith(DATABASE_EXTENSIONS):
+                upserted, removed, high_water = self._scan_database(path, row[1] if row else None)
+            else:
+                upserted, removed, high_water = self._scan_export(path)
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sources (source, signature, high_water, scanned_at) VALUES (?, ?, ?, ?)",
+                    (path, signature, high_water, time.time()),
+                )
+                self._conn.commit()
+            stats["scanned"] += 1
+            stats["upserted"] += upserted
+            stats["removed"] += removed
+        return stats
+
+    def added_since(self, since):
+        """Returns titles with new content after `since`, newest first, one per TMDB title.
+
+        Titles not yet resolved to a TMDB id are left out.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT type, tmdb_id, title, year, MAX(latest_at) FROM titles"
+                " WHERE latest_at > ? AND tmdb_id IS NOT NULL"
+                " GROUP BY type, tmdb_id ORDER BY MAX(latest_at) DESC",
+                (since,),
+            ).fetchall()
+        return [{"id": tmdb_id, "type": kind, "title": title, "year": year, "addedAt": latest_at}
+                for kind, tmdb_id, title, year, latest_at in rows]
+
+    def unresolved(self, since=0):
+        """Lists titles with content after `since` that have an IMDb/TVDB id but no TMDB id yet."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, key, type, imdb_id, tvdb_id FROM titles"
+                " WHERE tmdb_id IS NULL AND (imdb_id IS NOT NULL OR tvdb_id IS NOT NULL)"
+                " AND latest_at > ? AND (lookup_at IS NULL OR lookup_at < ?)",
+                (since, time.time() - self.resolve_retry),
+            ).fetchall()
+        return [dict(zip(("source", "key", "type", "imdb_id", "tvdb_id"), row)) for row in rows]
+
+    def set_tmdb_id(self, source, key, tmdb_id):
+        """Stores a resolved TMDB id; None records a failed lookup so it is retried later."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE titles SET tmdb_id = ?, lookup_at = ? WHERE source = ? AND key = ?",
+                (tmdb_id, time.time(), source, key),
+            )
+            self._conn.commit()
+
+    def mark_issue(self, timestamp):
+        """Remembers when the last issue went out; later issues list titles added after it."""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO marks (name, value) VALUES ('last_issue', ?)", (timestamp,))
+            self._conn.commit()
+
+    def last_issue_at(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM marks WHERE name = 'last_issue'").fetchone()
+        return row[0] if row else None
+
+    def stats(self):
+        with self._lock:
+            titles, unresolved = self._conn.execute(
+                "SELECT COUNT(*), SUM(tmdb_id IS NULL) FROM titles"
+            ).fetchone()
+            (sources,) = self._conn.execute("SELECT COUNT(*) FROM sources").fetchone()
+        return {"titles": titles, "unresolved": unresolved or 0, "sources": sources}
+
+    @staticmethod
+    def _expand(sources):
+        for source in sources:
+            if os.path.isdir(source):
+                for name in sorted(os.listdir(source)):
+                    if name.endswith(EXPORT_EXTENSIONS + DATABASE_EXTENSIONS):
+                        yield os.path.join(source, name)
+            else:
+                yield source
+
+    @staticmethod
+    def _signature(path):
+        # A live Plex database keeps recent writes in its -wal file
+        parts = []
+        for name in (path, f"{path}-wal"):
+            if os.path.exists(name):
+                stat = os.stat(name)
+                parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+        return "|".join(parts)
+
+    def _scan_export(self, path):
+        """Diffs a full export against the rows stored for it."""
+        reader = read_json_export if path.endswith(".json") else read_xml_export
+        titles, newest_episode = {}, {}
+        for entry in reader(path):
+            if entry["type"] == "episode":
+                if entry["show_key"] and entry["added_at"]:
+                    newest_episode[entry["show_key"]] = max(newest_episode.get(entry["show_key"], 0), entry["added_at"])
+            else:
+                titles[entry["key"]] = entry
+        for key, added_at in newest_episode.items():
+            if key in titles:
+                titles[key]["latest_at"] = max(titles[key]["added_at"] or 0, added_at)
+
+        with self._lock:
+            stored = dict(self._conn.execute(
+                "SELECT key, updated_at || ':' || latest_at FROM titles WHERE source = ?", (path,)
+            ).fetchall())
+            changed = [entry for key, entry in titles.items()
+                       if stored.get(key) != f"{entry['updated_at']}:{entry.get('latest_at', entry['added_at'])}"]
+            removed = [key for key in stored if key not in titles]
+            self._upsert(path, changed)
+            self._conn.executemany("DELETE FROM titles WHERE source = ? AND key = ?", [(path, key) for key in removed])
+            self._conn.commit()
+        high_water = max((entry["updated_at"] or 0 for entry in titles.values()), default=None)
+        return len(changed), len(removed), high_water
+
+    def _scan_database(self, path, high_water):
+        """Reads rows changed after `high_water` from a Plex library database, opened read-only."""
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            # Older databases store dates as text, which compares as text
+            (date_type,) = conn.execute(
+                "SELECT typeof(added_at) FROM metadata_items WHERE added_at IS NOT NULL LIMIT 1"
+            ).fetchone() or ("integer",)
+            since = high_water or 0
+            if date_type == "text":
+                since = datetime.fromtimestamp(since, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            type_filter = ", ".join(str(code) for code in DB_TYPES)
+            rows = conn.execute(
+                "SELECT m.id, m.metadata_type, m.title, m.year, m.guid, m.added_at, m.updated_at,"
+                " (SELECT group_concat(t.tag, ' ') FROM taggings g JOIN tags t ON t.id = g.tag_id"
+                f"  WHERE g.metadata_item_id = m.id AND t.tag_type = {DB_GUID_TAG})"
+                f" FROM metadata_items m WHERE m.metadata_type IN ({type_filter})"
+                " AND m.deleted_at IS NULL AND (m.added_at >= ? OR m.updated_at >= ?)",
+                (since, since),
+            ).fetchall()
+            episodes = conn.execute(
+                "SELECT season.parent_id, MAX(e.added_at) FROM metadata_items e"
+                " JOIN metadata_items season ON season.id = e.parent_id"
+                f" WHERE e.metadata_type = {DB_EPISODE} AND e.deleted_at IS NULL AND e.added_at >= ?"
+                " GROUP BY season.parent_id",
+                (since,),
+            ).fetchall()
+            live = {str(item_id) for (item_id,) in conn.execute(
+                f"SELECT id FROM metadata_items WHERE metadata_type IN ({type_filter}) AND deleted_at IS NULL"
+            )}
+        finally:
+            conn.close()
+
+        entries = []
+        for item_id, metadata_type, title, year, guid, added_at, updated_at, tags in rows:
+            added_at, updated_at = to_timestamp(added_at), to_timestamp(updated_at)
+            entries.append({
+                "key": str(item_id), "type": DB_TYPES[metadata_type], "title": title, "year": year,
+                "added_at": added_at, "updated_at": updated_at or added_at,
+                **parse_guids([guid] + (tags or "").split()),
+            })
+        with self._lock:
+            self._upsert(path, entries)
+            for show_id, added_at in episodes:
+                self._conn.execute(
+                    "UPDATE titles SET latest_at = MAX(COALESCE(latest_at, 0), ?) WHERE source = ? AND key = ?",
+                    (to_timestamp(added_at), path, str(show_id)),
+                )
+            stored = [key for (key,) in self._conn.execute("SELECT key FROM titles WHERE source = ?", (path,))]
+            removed = [key for key in stored if key not in live]
+            self._conn.executemany("DELETE FROM titles WHERE source = ? AND key = ?", [(path, key) for key in removed])
+            self._conn.commit()
+        changed_at = [entry["updated_at"] or 0 for entry in entries] + [to_timestamp(a) or 0 for _, a in episodes]
+        return len(entries), len(removed), max(changed_at + [high_water or 0]) or None
+
+    def _upsert(self, source, entries):
+        # A changed row keeps its resolved TMDB id unless the new data carries one
+        self._conn.executemany(
+            "INSERT INTO titles (source, key, type, title, year, tmdb_id, imdb_id, tvdb_id, added_at, updated_at, latest_at)"
+            " VALUES (:source, :key, :type, :title, :year, :tmdb_id, :imdb_id, :tvdb_id, :added_at, :updated_at, :latest_at)"
+            " ON CONFLICT (source, key) DO UPDATE SET type = excluded.type, title = excluded.title,"
+            " year = excluded.year, tmdb_id = COALESCE(excluded.tmdb_id, titles.tmdb_id),"
+            " imdb_id = excluded.imdb_id, tvdb_id = excluded.tvdb_id, added_at = excluded.added_at,"
+            " updated_at = excluded.updated_at,"
+            " latest_at = MAX(COALESCE(excluded.latest_at, 0), COALESCE(titles.latest_at, 0))",
+            [{
+                "source": source, "key": entry["key"], "type": entry["type"], "title": entry["title"],
+                "year": entry["year"], "tmdb_id": int(entry["tmdb_id"]) if str(entry.get("tmdb_id", "")).isdigit() else None,
+                "imdb_id": entry.get("imdb_id"), "tvdb_id": entry.get("tvdb_id"),
+                "added_at": entry["added_at"], "updated_at": entry["updated_at"],
+                "latest_at": entry.get("latest_at", entry["added_at"]),
+            } for entry in entries],
+        )
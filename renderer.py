@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from jinja2 import Environment, FileSystemLoader
+from markupsafe import Markup, escape
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "newsletter")
+
+
+def nl2br(value):
+    """Escapes text and turns newlines into <br> tags."""
+    return Markup("<br>").join(escape(value or "").split("\n"))
+
+
+def thousands(value):
+    return f"{value:,}"
+
+
+class Layout:
+    """A newsletter layout plugin.
+
+    collect() lists the raw items a request references, in the order they should be
+    enriched; context() turns the enriched results (same order, None for failures)
+    into the variables its template expects.
+    """
+
+    name = None
+    template = None
+
+    def collect(self, data):
+        raise NotImplementedError
+
+    def context(self, data, enriched):
+        raise NotImplementedError
+
+
+class ClassicLayout(Layout):
+    """Single column of full cards: "New This Week" followed by "Featured Library Picks"."""
+
+    name = "classic"
+    template = "classic.html"
+
+    def collect(self, data):
+        return data.get("newItems", []) + data.get("featuredItems", [])
+
+    def context(self, data, enriched):
+        count = len(data.get("newItems", []))
+        return {
+            "intro_text": data.get("introText", ""),
+            "new_items": [i for i in enriched[:count] if i],
+            "featured_intro_text": data.get("featuredIntroText", "Also on the server, check out these library picks!"),
+            "featured_items": [i for i in enriched[count:] if i],
+        }
+
+
+class MagazineLayout(Layout):
+    """Magazine sections with a large featured title beside a column of small cards."""
+
+    name = "magazine"
+    template = "magazine.html"
+
+    def collect(self, data):
+        featured = [data[key] for key in ("featuredNewItem", "featuredLibraryItem") if data.get(key)]
+        return data.get("newItems", []) + data.get("featuredItems", []) + featured
+
+    def context(self, data, enriched):
+        new_count = len(data.get("newItems", []))
+        featured_count = len(data.get("featuredItems", []))
+        remaining = iter(enriched[new_count + featured_count:])
+        featured_new = next(remaining) if data.get("featuredNewItem") else None
+        featured_library = next(remaining) if data.get("featuredLibraryItem") else None
+        sections = []
+        if featured_new or new_count:
+            # The featured item is the first of its list, so it is excluded from the small cards
+            sections.append({
+                "title": "NEW THIS WEEK",
+                "featured_item": featured_new,
+                "additional_items": [i for i in enriched[1:new_count] if i],
+                "longform_content": data.get("newItemsLongform", ""),
+            })
+        if featured_library or featured_count:
+            sections.append({
+                "title": "PLEX PICKS - THIS WEEK'S FEATURE",
+                "featured_item": featured_library,
+                "additional_items": [i for i in enriched[new_count + 1:new_count + featured_count] if i],
+                "longform_content": data.get("libraryPicksLongform", ""),
+            })
+        return {"intro_text": data.get("introText", ""), "sections": sections}
+
+
+LAYOUTS = {layout.name: layout for layout in (ClassicLayout(), MagazineLayout())}
+
+
+def detect_layout(data):
+    """Picks a layout for requests that don't name one, based on the fields they send."""
+    magazine_keys = ("featuredNewItem", "featuredLibraryItem", "newItemsLongform", "libraryPicksLongform")
+    return "magazine" if any(data.get(key) is not None for key in magazine_keys) else "classic"
+
+
+def get_layout(data):
+    name = data.get("layout") or detect_layout(data)
+    if not isinstance(name, str) or name not in LAYOUTS:
+        raise ValueError(f"Unknown newsletter layout: {name}")
+    return LAYOUTS[name]
+
+
+class FragmentCache:
+    """LRU of rendered card fragments keyed by a content hash of everything they depend on."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(variant, item, args):
+        payload = json.dumps([variant, item, args], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def put(self, key, fragment):
+        with self._lock:
+            self._entries[key] = fragment
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class NewsletterRenderer:
+    """Renders layouts from Jinja templates that are compiled once, up front.
+
+    Output is autoescaped, so titles, overviews and blurbs can't inject markup, and
+    templates render by joining generated chunks rather than repeated concatenation.
+    Templates render cards through card(), which memoizes each fragment by a hash of
+    the card variant, the enriched item (blurb included) and any extra arguments, so
+    re-rendering an issue only renders the cards whose content changed.
+
+    With a `fragment_store`, cards are also kept across restarts and issues, already
+    passed through `finalize_fragment`. Their version hash also covers the card
+    templates and `settings_fingerprint` (anything else that changes card output, such
+    as poster settings), so editing either invalidates them. A stored card for which
+    `check_fragment` returns False (e.g. its posters are no longer in the image cache) is
+    rendered again, which also re-registers whatever its template sets up.
+    """
+
+    def __init__(self, owner_name, template_dir=TEMPLATE_DIR, fragment_cache_size=2048, poster_url=None,
+                 fragment_store=None, finalize_fragment=None, settings_fingerprint="", check_fragment=None):
+        self.env = Environment(
+            loader=FileSystemLoader(template_dir),
+            autoescape=True,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            auto_reload=False,
+        )
+        self.env.filters["nl2br"] = nl2br
+        self.env.filters["thousands"] = thousands
+        self.env.globals["owner_name"] = owner_name
+        self.env.globals["card"] = self.render_card
+        # poster(url, variant) maps a TMDB poster URL to the image served for that card size
+        self.env.globals["poster"] = poster_url or (lambda url, variant: url)
+        self.fragments = FragmentCache(fragment_cache_size)
+        self.templates = {name: self.env.get_template(layout.template) for name, layout in LAYOUTS.items()}
+        self.cards = self.env.get_template("cards.html").module
+        self.store = fragment_store
+        self.finalize_fragment = finalize_fragment or (lambda html: html)
+        self.check_fragment = check_fragment or (lambda html: True)
+        cards_source = self.env.loader.get_source(self.env, "cards.html")[0]
+        self.fragment_salt = hashlib.sha256(f"{cards_source}\0{owner_name}\0{settings_fingerprint}".encode("utf-8")).hexdigest()
+
+    def render_card(self, variant, item, *args):
+        """Renders one card macro ("item_card", "small_card", "featured_item"), reusing cached output."""
+        key = FragmentCache.key(variant, item, args)
+        fragment = self.fragments.get(key)
+        if fragment is not None:
+            return fragment
+        # Enriched items carry their TMDB id; anything else is only memoized in memory
+        title = f"{item.get('type')}:{item['id']}" if self.store is not None and item.get("id") else None
+        version = hashlib.sha256(f"{self.fragment_salt}:{key}".encode("utf-8")).hexdigest()
+        stored = self.store.get(title, variant, version) if title else None
+        if stored is not None and self.check_fragment(stored):
+            fragment = Markup(stored)
+        else:
+            fragment = Markup(self.finalize_fragment(str(getattr(self.cards, variant)(item, *args))))
+            if title:
+                self.store.put(title, variant, version, str(fragment))
+        self.fragments.put(key, fragment)
+        return fragment
+
+    def render(self, layout, context):
+        return self.templates[layout.name].render(context)
+
+    def stream(self, layout, context):
+        """Yields the document in chunks as it renders."""
+        return self.templates[layout.name].generate(context)
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Lowercases a search query and collapses whitespace so "Dune " and "dune" share an entry."""
+    return " ".join(query.lower().split())
+
+
+class QueryCache:
+    """Small in-memory LRU of recent /search results with a short TTL.
+
+    Besides exact hits, a query can be answered from a cached shorter prefix ("dun" for
+    "dune") when that prefix's result set was complete, i.e. TMDB returned every match
+    rather than just the first page. The longer query's results are then a filtered
+    subset of the cached ones.
+    """
+
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query):
+        """Returns cached results for a normalized query, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._fresh_entry(query, now)
+            if entry is not None:
+                self.hits += 1
+                return entry[1]
+            for end in range(len(query) - 1, 0, -1):
+                entry = self._fresh_entry(query[:end], now)
+                if entry is not None and entry[2]:
+                    self.hits += 1
+                    return [item for item in entry[1] if query in normalize_query(item["title"])]
+            self.misses += 1
+            return None
+
+    def put(self, query, items, complete):
+        """Stores results; `complete` marks them as the full match set, usable for prefix reuse."""
+        with self._lock:
+            self._entries[query] = (time.monotonic(), items, complete)
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _fresh_entry(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry[0] >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
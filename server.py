@@ -0,0 +1,67 @@
+"""Production entry point: serves the app with Waitress instead of Flask's development server.
+
+    pip install waitress
+    python server.py
+
+The app runs in a single process: jobs, previews and caches live in memory, so requests
+are spread over SERVER_THREADS threads rather than several processes. Waitress reads
+requests and writes responses on its own event loop, so idle keep-alive connections
+don't hold a thread, but every request holds one until its handler returns. Generation,
+sends and library scans run on the job queue and only take a thread briefly to queue the
+job, and the editors poll /jobs/<id> for progress. /search (when it asks TMDB), /preview
+(while looking up newly added titles), /export (up to 4 x EXPORT_TIMEOUT) and
+/jobs/<id>/events streams hold their thread while they work; the README's "Running in
+Production" section covers sizing SERVER_THREADS for them. On SIGTERM or Ctrl+C the
+server stops serving, then waits up to SHUTDOWN_TIMEOUT seconds for queued and running
+sends before exiting.
+"""
+import logging
+import os
+import signal
+import sys
+
+from dotenv import load_dotenv
+
+try:
+    from waitress import create_server
+except ImportError:  # Waitress is optional; without it only the development server (python app.py) is available
+    create_server = None
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "5000"))
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", "16"))
+SERVER_CONNECTION_LIMIT = int(os.getenv("SERVER_CONNECTION_LIMIT", "200"))
+# Honor X-Forwarded-* headers from a reverse proxy at this address (e.g. 127.0.0.1)
+SERVER_TRUSTED_PROXY = os.getenv("SERVER_TRUSTED_PROXY")
+
+
+def _stop(signum, frame):
+    # Waitress's loop exits on SystemExit and finishes the requests in progress
+    raise SystemExit(0)
+
+
+def main():
+    if create_server is None:
+        sys.exit("The production server needs Waitress: pip install waitress")
+    # Imported here, not at the top: the finalizer's spawned workers re-run this script and
+    # must not set up a second copy of the app
+    from app import create_app, shutdown
+
+    options = {}
+    if SERVER_TRUSTED_PROXY:
+        options = {"trusted_proxy": SERVER_TRUSTED_PROXY, "trusted_proxy_headers": "x-forwarded-for x-forwarded-host x-forwarded-proto"}
+    server = create_server(create_app(), host=SERVER_HOST, port=SERVER_PORT, threads=SERVER_THREADS,
+                           connection_limit=SERVER_CONNECTION_LIMIT, ident=None, **options)
+    signal.signal(signal.SIGTERM, _stop)
+    logger.info("Serving", extra={"fields": {"host": SERVER_HOST, "port": SERVER_PORT, "threads": SERVER_THREADS}})
+    try:
+        server.run()
+    finally:
+        shutdown()
+
+
+if __name__ == "__main__":
+    main()
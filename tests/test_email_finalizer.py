@@ -0,0 +1,62 @@
+import os
+import sys
+
+import lxml.html
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_finalizer import finalize_document
+from renderer import LAYOUTS, NewsletterRenderer
+
+
+def enriched_item(index, item_type="Movie"):
+    return {
+        "id": index, "type": item_type, "title": f"Title {index} & <Friends>", "year": "2024",
+        "rating": 7.5, "votes": 12345, "genres": "Drama, Comedy",
+        "poster_url": f"https://image.tmdb.org/t/p/w500/poster{index}.jpg",
+        "overview": "An overview.\nOn two lines.", "blurb": f"Blurb {index}",
+        "rt_critic_score": "91%" if item_type == "Movie" else None,
+    }
+
+
+REQUESTS = {
+    "classic": {
+        "introText": "Hello!\nWelcome back.",
+        "newItems": [{"id": i} for i in range(3)],
+        "featuredItems": [{"id": i} for i in range(3, 5)],
+    },
+    "magazine": {
+        "introText": "Hello!",
+        "newItems": [{"id": i} for i in range(3)],
+        "featuredItems": [{"id": i} for i in range(3, 6)],
+        "featuredNewItem": {"id": 0},
+        "featuredLibraryItem": {"id": 3},
+        "newItemsLongform": "Longform text.",
+        "libraryPicksLongform": "More longform text.",
+    },
+}
+
+
+def render(layout_name):
+    layout = LAYOUTS[layout_name]
+    data = REQUESTS[layout_name]
+    items = layout.collect(data)
+    enriched = [enriched_item(item["id"], "Movie" if item["id"] % 2 else "TV Show") for item in items]
+    return NewsletterRenderer("Test Server").render(layout, layout.context(data, enriched))
+
+
+def dom(html):
+    """Tags, attributes and text of every element, ignoring whitespace between tags."""
+    tree = lxml.html.document_fromstring(html)
+    return [(element.tag, dict(element.attrib), (element.text or "").strip(), (element.tail or "").strip())
+            for element in tree.iter() if isinstance(element.tag, str)]
+
+
+@pytest.mark.parametrize("layout_name", sorted(LAYOUTS))
+def test_fast_path_matches_premailer(layout_name):
+    html = render(layout_name)
+    fast_path, fast = finalize_document(html, "fast")
+    premailer_path, full = finalize_document(html, "premailer")
+    assert (fast_path, premailer_path) == ("fast", "premailer")
+    assert dom(fast) == dom(full)
@@ -0,0 +1,240 @@
+"""Local trigram index over TMDB titles, so /search can answer without calling TMDB.
+
+Build it from TMDB's daily id exports (http://files.tmdb.org/p/exports/) and/or the
+metadata cache, then point SEARCH_INDEX_PATH at the result:
+
+    python title_index.py --export movie_ids_10_17_2026.json.gz --export tv_series_ids_10_17_2026.json.gz \\
+        --metadata-cache metadata_cache.sqlite3 --output title_index.bin
+"""
+import argparse
+import gzip
+import heapq
+import json
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import unicodedata
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+MAGIC = b"TTLIDX01"
+# magic, byte order, record count, trigram count, then offsets of the records, strings,
+# trigram keys, postings directory and postings sections
+HEADER = struct.Struct("<8s1s3xII5Q")
+# tmdb id, popularity, title/normalized title/poster path offsets, year,
+# title/normalized title lengths, poster path length, type
+RECORD = struct.Struct("<IfIIIHHHBB")
+TYPES = ("movie", "tv")
+
+
+def normalize_title(title):
+    """Lowercases, strips accents and turns punctuation into spaces ("Amélie" -> "amelie", "Spider-Man" -> "spider man")."""
+    decomposed = unicodedata.normalize("NFKD", title or "")
+    text = "".join(ch if ch.isalnum() else " " for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(text.lower().split())
+
+
+def title_trigrams(normalized):
+    """Trigrams of a normalized title, padded so the start and the end of the title get their own trigrams."""
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def query_trigrams(normalized):
+    # No end padding: a query is often the first part of a title typed so far
+    padded = f"  {normalized}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_key(trigram):
+    return zlib.crc32(trigram.encode("utf-8"))
+
+
+class TitleIndex:
+    """Read-only, memory-mapped trigram index.
+
+    Records are stored in descending popularity, so every postings list is too. A query
+    counts shared trigrams starting with its rarest ones. Only the first `max_postings`
+    entries of each list are read in total, so common trigrams such as "the" cost no
+    more than a bounded number of the most popular titles. The best candidates are then
+    scored on trigram overlap, exact and prefix matches, and popularity.
+    """
+
+    def __init__(self, path, max_postings=25000, max_candidates=100):
+        self.path = path
+        self.max_postings = max_postings
+        self.max_candidates = max_candidates
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, byteorder, self.size, self.trigram_count,
+         self._records, self._strings, keys, directory, postings) = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a title index")
+        if byteorder != sys.byteorder[0].encode():
+            raise ValueError(f"{path} was built on a machine with a different byte order")
+        view = memoryview(self._mm)
+        self._keys = view[keys:keys + 4 * self.trigram_count].cast("I")
+        self._directory = view[directory:directory + 8 * self.trigram_count].cast("I")
+        self._postings = view[postings:].cast("I")
+
+    def record(self, index):
+        (tmdb_id, popularity, title_at, normalized_at, poster_at, year,
+         title_len, normalized_len, poster_len, kind) = RECORD.unpack_from(self._mm, self._records + RECORD.size * index)
+        strings = self._strings
+        return {
+            "id": tmdb_id, "type": TYPES[kind], "popularity": popularity, "year": year or None,
+            "title": self._mm[strings + title_at:strings + title_at + title_len].decode("utf-8"),
+            "normalized": self._mm[strings + normalized_at:strings + normalized_at + normalized_len].decode("utf-8"),
+            "poster_path": self._mm[strings + poster_at:strings + poster_at + poster_len].decode("utf-8") or None,
+        }
+
+    def search(self, query, limit=20, min_score=0.5):
+        """Returns up to `limit` records ranked by match quality, each with a "score" in [0, ~1.7]."""
+        normalized = normalize_title(query)
+        grams = query_trigrams(normalized)
+        if not grams:
+            return []
+        lists = []
+        for gram in grams:
+            key = trigram_key(gram)
+            position = bisect_left(self._keys, key)
+            if position < self.trigram_count and self._keys[position] == key:
+                lists.append((self._directory[2 * position + 1], self._directory[2 * position]))
+
+        counts = Counter()
+        budget = self.max_postings
+        for count, start in sorted(lists):
+            take = min(count, max(budget, 1000))
+            counts.update(self._postings[start:start + take])
+            budget -= take
+        needed = max(1, math.ceil(len(grams) * min_score))
+        candidates = [(shared, -index) for index, shared in counts.items() if shared >= needed]
+        candidates = heapq.nlargest(self.max_candidates, candidates)
+
+        results = []
+        for _, index in candidates:
+            record = self.record(-index)
+            target = title_trigrams(record["normalized"])
+            shared = len(grams & target)
+            coverage = shared / len(grams)
+            if coverage < min_score:
+                continue
+            score = 0.8 * coverage + 0.2 * shared / len(target)
+            if record["normalized"] == normalized:
+                score += 0.5
+            elif record["normalized"].startswith(normalized):
+                score += 0.2
+            record["score"] = score
+            results.append(record)
+        results.sort(key=lambda r: r["score"] + 0.05 * math.log1p(r["popularity"]), reverse=True)
+        return results[:limit]
+
+    def close(self):
+        self._keys.release()
+        self._directory.release()
+        self._postings.release()
+        self._mm.close()
+
+
+def read_tmdb_export(path):
+    """Yields (type, id, title, popularity) from a TMDB daily id export (gzipped JSON lines)."""
+    kind = "tv" if os.path.basename(path).startswith("tv_") else "movie"
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get("adult") or entry.get("video"):
+                continue
+            title = entry.get("original_title") or entry.get("original_name")
+            if title:
+                yield kind, entry["id"], title, entry.get("popularity", 0.0)
+
+
+def read_metadata_cache(path):
+    """Yields (type, id, title, year, poster_path) for titles cached by the app."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for key, payload in conn.execute("SELECT key, payload FROM entries WHERE namespace = 'tmdb' AND payload IS NOT NULL"):
+            kind, tmdb_id = key.split(":", 1)
+            details = json.loads(payload)
+            poster = (details.get("poster_url") or "").rsplit("/w500", 1)[-1]
+            year = details.get("year") or ""
+            yield kind, int(tmdb_id), details.get("title"), int(year) if year.isdigit() else 0, poster if poster.startswith("/") else ""
+    finally:
+        conn.close()
+
+
+def build_index(output, exports=(), metadata_cache=None, min_popularity=0.0):
+    """Writes an index combining the exports (titles and popularity) with cached details (display titles, years, posters)."""
+    titles = {}
+    for path in exports:
+        for kind, tmdb_id, title, popularity in read_tmdb_export(path):
+            if popularity >= min_popularity:
+                titles[(kind, tmdb_id)] = [title, popularity, 0, ""]
+    if metadata_cache:
+        for kind, tmdb_id, title, year, poster in read_metadata_cache(metadata_cache):
+            entry = titles.setdefault((kind, tmdb_id), [title, 0.0, 0, ""])
+            entry[0], entry[2], entry[3] = title or entry[0], year, poster
+
+    ordered = sorted(titles.items(), key=lambda item: -item[1][1])
+    records, strings, postings = bytearray(), bytearray(), {}
+    for index, ((kind, tmdb_id), (title, popularity, year, poster)) in enumerate(ordered):
+        normalized = normalize_title(title)
+        encoded = [value.encode("utf-8")[:limit] for value, limit in ((title, 65535), (normalized, 65535), (poster, 255))]
+        offsets = []
+        for value in encoded:
+            offsets.append(len(strings))
+            strings += value
+        records += RECORD.pack(tmdb_id, popularity, *offsets, min(year, 65535),
+                               len(encoded[0]), len(encoded[1]), len(encoded[2]), TYPES.index(kind))
+        for gram in title_trigrams(normalized):
+            postings.setdefault(trigram_key(gram), array("I")).append(index)
+
+    keys, directory, blob = array("I", sorted(postings)), array("I"), array("I")
+    for key in keys:
+        directory.extend((len(blob), len(postings[key])))
+        blob.extend(postings[key])
+
+    records_at = HEADER.size
+    strings_at = records_at + len(records)
+    keys_at = _aligned(strings_at + len(strings))
+    directory_at = keys_at + 4 * len(keys)
+    postings_at = directory_at + 4 * len(directory)
+    with open(f"{output}.tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, sys.byteorder[0].encode(), len(ordered), len(keys),
+                            records_at, strings_at, keys_at, directory_at, postings_at))
+        f.write(records)
+        f.write(strings)
+        f.write(b"\0" * (keys_at - strings_at - len(strings)))
+        f.write(keys.tobytes())
+        f.write(directory.tobytes())
+        f.write(blob.tobytes())
+    # Swap atomically so a running app never maps a half-written file
+    os.replace(f"{output}.tmp", output)
+    return len(ordered)
+
+
+def _aligned(offset):
+    return (offset + 3) // 4 * 4
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--export", action="append", default=[], help="TMDB daily id export (movie_ids_*.json.gz, tv_series_ids_*.json.gz)")
+    parser.add_argument("--metadata-cache", help="the app's metadata cache, for years and posters")
+    parser.add_argument("--min-popularity", type=float, default=0.0, help="skip export titles below this popularity")
+    parser.add_argument("--output", default="title_index.bin")
+    args = parser.parse_args()
+    if not args.export and not args.metadata_cache:
+        parser.error("give at least one --export or --metadata-cache")
+    count = build_index(args.output, args.export, args.metadata_cache, args.min_popularity)
+    print(f"Indexed {count} titles into {args.output}")
+
+
+if __name__ == "__main__":
+    main()